@@ -3,13 +3,18 @@
 
 # built-ins
 import os
-from datetime import datetime
-from io import BytesIO
+import sys
+import json
+import time
+import random
+import threading
+import functools
+from datetime import datetime, timedelta, timezone
 import xml.etree.ElementTree as etree
-from collections import Counter
 from decimal import Decimal
-# 3rd party dependencies
-import requests
+# 3rd party dependencies are imported lazily by the
+# Donbest client so the parsing and model layer can be
+# used without loading an HTTP stack.
 
 
 class APITokenMissingError(Exception):
@@ -36,6 +41,34 @@ class ConnectionClosedError(Exception):
     pass
 
 
+class TransportError(Exception):
+    pass
+
+
+class RequestTimeoutError(TransportError):
+    pass
+
+
+class HTTPStatusError(Exception):
+    pass
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class ResponseTooLargeError(Exception):
+    pass
+
+
+class StaleSnapshotError(Exception):
+    pass
+
+
+class CassetteMissError(Exception):
+    pass
+
+
 class BaseDonbestResponse(object):
     """Base object containing methods and attributes that
     other generated objects will inherit and use to set
@@ -58,6 +91,15 @@ class BaseDonbestResponse(object):
     BOOLEAN_FIELDS = ["time_changed", "neutral", "live", "no_line"]
     DATE_FORMATS = ["%Y-%m-%dT%H:%M:%S+0", "%Y-%m-%dT%H:%M:%S+0000"]
 
+    # Field name -> type lookup built once from the lists
+    # above, in order of precedence, so casting a value is
+    # a single dict lookup rather than several list scans.
+    FIELD_TYPES = {}
+    FIELD_TYPES.update(dict.fromkeys(BOOLEAN_FIELDS, "boolean"))
+    FIELD_TYPES.update(dict.fromkeys(DECIMAL_FIELDS, "decimal"))
+    FIELD_TYPES.update(dict.fromkeys(INT_FIELDS, "int"))
+    FIELD_TYPES.update(dict.fromkeys(DATE_FIELDS, "date"))
+
     def __init__(self, node, donbest):
         super().__init__()
         self.node = node
@@ -74,57 +116,42 @@ class BaseDonbestResponse(object):
         the library into other python code.
         """
         if value == "" or value == " " or value is None:
-            v = None
-        else:
-            if key in BaseDonbestResponse.DATE_FIELDS:
-                for fmat in BaseDonbestResponse.DATE_FORMATS:
-                    try:
-                        v = datetime.strptime(value, fmat)
-                    except ValueError as e:
-                        pass
-            elif key in BaseDonbestResponse.INT_FIELDS:
+            return None
+        field_type = BaseDonbestResponse.FIELD_TYPES.get(key)
+        if field_type is None:
+            return value
+        elif field_type == "date":
+            for fmat in BaseDonbestResponse.DATE_FORMATS:
                 try:
-                    v = int(value)
-                except Exception as e:
-                    v = value
-            elif key in BaseDonbestResponse.DECIMAL_FIELDS:
-                v = Decimal(value)
-            elif key in BaseDonbestResponse.BOOLEAN_FIELDS:
-                if str.lower(value) == 'true':
-                    v = True
-                elif str.lower(value) == 'false':
-                    v = False
-            else:
-                v = value
-        return v
+                    return datetime.strptime(value, fmat)
+                except ValueError as e:
+                    pass
+            return value
+        elif field_type == "int":
+            try:
+                return int(value)
+            except Exception as e:
+                return value
+        elif field_type == "decimal":
+            return Decimal(value)
+        else:
+            lowered = value.lower()
+            if lowered == 'true':
+                return True
+            elif lowered == 'false':
+                return False
+            return value
 
     def to_dict(self):
         """Returns object as a python dictionary.
         This method is overwritten in other objects
         where the dictionary needs to be nested.
         """
-        data = vars(self)
+        data = dict(vars(self))
         data.pop('node')
         data.pop('_donbest')
         return data
 
-    # Returns list of XML tags that appear more 
-    # than once as children of the specified element.
-    def _get_duplicate_children(self, element):
-        children = list(element)
-        tags = [child.tag for child in children]
-        dupes = [tag for tag, count in Counter(tags).items() if count > 1]
-        return dupes
-
-    # Returns list of XML elements that are
-    # children of the specific element with
-    # duplicates removed.
-    def _get_single_children(self, element):
-        dupes = self._get_duplicate_children(element)
-        children = [child for child in list(element) if child.tag not in dupes]
-        singles = [child for child in children if len(child) == 0]
-        return singles
-
     # Sets a single class attribute from 
     # a single XML element. Attribute name is
     # set to element.tag and the attribute 
@@ -146,34 +173,51 @@ class BaseDonbestResponse(object):
                 v = self.cast_value(k, v)
                 setattr(self, k, v)
 
-    # Sets class attributes from non-dupe children
-    # of the specific XML element.
-    def _setattr_from_single_children(self, element, use_tag=True):
-        singles = self._get_single_children(element)
-        for child in singles:
-            if not child.attrib:
-                self._setattr_from_text(child)
+    # Sets class attributes from the children of the
+    # specific XML element in a single scan. Children that
+    # appear once and have no children of their own are set
+    # from their text or attributes. Repeated children are
+    # skipped unless take_first is set, in which case the
+    # text of the first one is used. The element itself is
+    # never modified.
+    def _setattr_from_children(self, element, use_tag=True, take_first=False):
+        children = {}
+        for child in element:
+            entry = children.get(child.tag)
+            if entry is None:
+                children[child.tag] = [child, 1]
             else:
-                if "link" in child.attrib.keys():
-                    child.attrib.pop("link")
-                    pass
-                if use_tag and len(child.attrib.keys()) > 0:
-                    for k, v in child.attrib.items():
-                        v = self.cast_value(k, v)
-                        child.attrib[k] = v
-                    setattr(self, child.tag, child.attrib)
+                entry[1] += 1
+
+        cast_value = self.cast_value
+        dupes = []
+        for tag, (child, count) in children.items():
+            if count > 1:
+                dupes.append(child)
+            elif len(child) == 0:
+                attrib = child.attrib
+                if not attrib:
+                    if tag != 'link':
+                        setattr(self, tag, cast_value(tag, child.text))
+                elif use_tag and (len(attrib) > 1 or "link" not in attrib):
+                    setattr(self, tag, {
+                        k: cast_value(k, v)
+                        for k, v in attrib.items() if k != "link"})
                 else:
                     self._setattr_from_attributes(child)
 
-    # Sets class attributes from duplicate children
-    # which is handled differently than the single
-    # use case.
-    def _setattr_from_dupe_children(self, element, take_first=False):
-        dupes = self._get_duplicate_children(element)
-        for d in dupes:
-            children = element.findall(d)
-            if take_first:
-                self._setattr_from_text(children[0])
+        if take_first:
+            for child in dupes:
+                self._setattr_from_text(child)
+
+    # Returns the first direct child of the element
+    # for each tag, found in a single scan.
+    @staticmethod
+    def _first_children(element):
+        first = {}
+        for child in element:
+            first.setdefault(child.tag, child)
+        return first
 
     # Returns all non-internal attributes
     # for an easier readout of each class.
@@ -200,7 +244,7 @@ class Sport(BaseDonbestResponse):
         self.abbreviation = None
         self.information = None
         self._setattr_from_attributes(self.node)
-        self._setattr_from_single_children(self.node)
+        self._setattr_from_children(self.node)
 
 class League(BaseDonbestResponse):
     """Returns a League"""
@@ -212,7 +256,7 @@ class League(BaseDonbestResponse):
         self.information = None
         self.sport = None
         self._setattr_from_attributes(self.node)
-        self._setattr_from_single_children(self.node)
+        self._setattr_from_children(self.node)
 
     @classmethod
     def from_xml_collection(cls, node, sport, donbest):
@@ -236,7 +280,7 @@ class Team(BaseDonbestResponse):
         self.rotation = None
         self.side = None
         self._setattr_from_attributes(self.node)
-        self._setattr_from_single_children(self.node)
+        self._setattr_from_children(self.node)
 
     @classmethod
     def from_xml_collection(cls, node, league, donbest):
@@ -254,7 +298,7 @@ class Team(BaseDonbestResponse):
         XML responses.
         """
         l = cls(node=node, donbest=donbest)
-        l.rotation = rotation
+        l.rotation = l.cast_value("rot", rotation)
         l.side = side
         return l
 
@@ -282,7 +326,7 @@ class Location(BaseDonbestResponse):
         self.elevation = None
         self.city = None
         self._setattr_from_attributes(self.node)
-        self._setattr_from_single_children(self.node)
+        self._setattr_from_children(self.node)
 
     @classmethod
     def from_xml_collection(cls, node, city, donbest):
@@ -303,7 +347,7 @@ class City(BaseDonbestResponse):
         self.postalCode = None
         self.state = None
         self._setattr_from_attributes(self.node)
-        self._setattr_from_single_children(self.node)
+        self._setattr_from_children(self.node)
 
 class Sportsbook(BaseDonbestResponse):
     """"Returns a Sportsbook"""
@@ -313,8 +357,7 @@ class Sportsbook(BaseDonbestResponse):
         self.name = None
         self.abbreviation = None
         self._setattr_from_attributes(self.node)
-        self._setattr_from_single_children(self.node)
-        self._setattr_from_dupe_children(self.node, take_first=True)
+        self._setattr_from_children(self.node, take_first=True)
 
 class PointSpread(BaseDonbestResponse):
     """Returns a PointSpread"""
@@ -385,11 +428,12 @@ class Line(BaseDonbestResponse):
         """
         l = cls(node=node, donbest=donbest)
         l.event = event
-        ps = l.node.find(".//ps")
-        money = l.node.find(".//money")
-        total = l.node.find(".//total")
-        team_total = l.node.find(".//team_total")
-        display = l.node.find(".//display")
+        children = l._first_children(l.node)
+        ps = children.get("ps")
+        money = children.get("money")
+        total = children.get("total")
+        team_total = children.get("team_total")
+        display = children.get("display")
 
         if ps is not None:
             l.ps = PointSpread(ps, donbest=donbest)
@@ -435,7 +479,7 @@ class Event(BaseDonbestResponse):
         self.location = None
         self.live = None
         self._setattr_from_attributes(self.node)
-        self._setattr_from_single_children(self.node)
+        self._setattr_from_children(self.node)
 
     @classmethod
     def from_full_xml_collection(cls, node, league, group, donbest):
@@ -446,26 +490,32 @@ class Event(BaseDonbestResponse):
         e = cls(node=node, donbest=donbest)
         e.league = league
         e.group = group
-        e.location = Location(e.node.find(".//location"), donbest=e)
-
-        participants = e.node.findall(".//participant")
-        if participants is not None:
-            parts = []
-            for p in participants:
-                if p.find(".//team") is not None:
-                    if "rotation_number" in p.attrib.keys():
-                        rot = p.attrib["rotation_number"]
-                    elif "rot" in p.attrib.keys():
-                        rot = p.attrib["rot"]
-                    if "side" in p.attrib.keys():
-                        side = p.attrib["side"]
-                    t = p.find(".//team")
-                    team = Team.from_participant_node(
-                        node=t, rotation=rot, side=side, donbest=e)
-                    parts.append(team)
-                elif "name" in p.attrib.keys():
-                    parts.append(p.attrib)
-            e.participants = parts
+        location = None
+        participants = []
+        for child in e.node:
+            if child.tag == "participant":
+                participants.append(child)
+            elif child.tag == "location" and location is None:
+                location = child
+        if location is not None:
+            e.location = Location(location, donbest=e)
+
+        parts = []
+        for p in participants:
+            t = e._first_children(p).get("team")
+            if t is not None:
+                if "rotation_number" in p.attrib.keys():
+                    rot = p.attrib["rotation_number"]
+                elif "rot" in p.attrib.keys():
+                    rot = p.attrib["rot"]
+                if "side" in p.attrib.keys():
+                    side = p.attrib["side"]
+                team = Team.from_participant_node(
+                    node=t, rotation=rot, side=side, donbest=e)
+                parts.append(team)
+            elif "name" in p.attrib.keys():
+                parts.append(dict(p.attrib))
+        e.participants = parts
 
         return e
 
@@ -477,15 +527,17 @@ class Event(BaseDonbestResponse):
         e = cls(node=node, donbest=donbest)
         e.league = league
         e.group = group
-        e.location = Location(e.node.find(".//location"), donbest=e)
-
-        participants = e.node.findall(".//participant")
-        if participants is not None:
-            parts = []
-            for p in participants:
-                team = Team.from_inplay_participant_node(node=p, donbest=e)
+        location = None
+        parts = []
+        for child in e.node:
+            if child.tag == "participant":
+                team = Team.from_inplay_participant_node(node=child, donbest=e)
                 parts.append(team)
-            e.participants = parts
+            elif child.tag == "location" and location is None:
+                location = child
+        if location is not None:
+            e.location = Location(location, donbest=e)
+        e.participants = parts
 
         return e
 
@@ -527,10 +579,7 @@ class Period(BaseDonbestResponse):
         API response.
         """
         p = cls(node, donbest=donbest)
-        scores = p.node.findall(".//score")
-        if scores is not None:
-            score_list = [score.attrib for score in scores]
-        p.scores = score_list
+        p.scores = [dict(score.attrib) for score in p.node if score.tag == "score"]
 
         return p
 
@@ -552,7 +601,7 @@ class Score(BaseDonbestResponse):
         self.home_score_ext = None
         self.period_summary = None
         self._setattr_from_attributes(self.node)
-        self._setattr_from_single_children(self.node, use_tag=False)
+        self._setattr_from_children(self.node, use_tag=False)
 
     @classmethod
     def from_xml_collection(cls, node, donbest):
@@ -560,21 +609,2053 @@ class Score(BaseDonbestResponse):
         donbest.score() XML response.
         """
         s = cls(node=node, donbest=donbest)
-        period_summary = s.node.find(".//period_summary")
+        period_summary = s._first_children(s.node).get("period_summary")
         if period_summary is not None:
-            periods = period_summary.findall(".//period")
-            if periods is not None:
-                p_list = []
-                for period in periods:
+            p_list = []
+            for period in period_summary:
+                if period.tag == "period":
                     p = Period.from_period_summary(period, donbest=donbest)
                     p_list.append(p)
             s.period_summary = p_list
         return s
 
+# Schedule participants carry their rotation number in
+# `rotation`, in-play participants in `rot`.
+def _participant_rotation(team):
+    rotation = getattr(team, "rotation", None)
+    if rotation in (None, ""):
+        rotation = getattr(team, "rot", None)
+    try:
+        return int(rotation)
+    except (TypeError, ValueError):
+        return None
+
+### XML BACKENDS ###
+
+def _xml_backend(name):
+    """Returns a factory for incremental (feed/close) XML
+    parsers of the named backend. close() returns the root
+    of an ElementTree-compatible tree.
+    """
+    if name in ("auto", "lxml"):
+        try:
+            from lxml import etree as lxml_etree
+        except ImportError as e:
+            if name == "lxml":
+                raise ImportError(
+                    "The lxml parser requires lxml. "
+                    "Install it with `pip install lxml`.") from e
+        else:
+            return functools.partial(
+                lxml_etree.XMLParser, remove_comments=True,
+                remove_pis=True, huge_tree=True)
+    return etree.XMLParser
+
+
+### ANALYTICS ###
+
+# numpy is an optional dependency that is only
+# needed for the odds analytics below.
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError(
+            "The odds analytics require numpy. "
+            "Install it with `pip install numpy`.") from e
+    return numpy
+
+
+def american_to_decimal(prices):
+    """Converts American prices to decimal odds. Accepts a
+    scalar or any array-like and returns a numpy array.
+    Missing prices (None, NaN or 0) become NaN.
+    """
+    np = _import_numpy()
+    p = np.asarray(prices, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d = np.where(p > 0, 1 + p / 100, 1 + 100 / -p)
+    return np.where(p == 0, np.nan, d)
+
+
+def implied_probability(prices):
+    """Converts American prices to implied probabilities,
+    including the bookmaker's margin.
+    """
+    return 1 / american_to_decimal(prices)
+
+
+def probability_to_american(probabilities):
+    """Converts probabilities to American prices."""
+    np = _import_numpy()
+    q = np.asarray(probabilities, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(q >= 0.5, -100 * q / (1 - q), 100 * (1 - q) / q)
+
+
+def no_vig(probabilities):
+    """Removes the margin from a (n, sides) array of implied
+    probabilities by normalising each row to sum to one.
+    Missing sides (NaN) are ignored.
+    """
+    np = _import_numpy()
+    q = np.asarray(probabilities, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return q / np.nansum(q, axis=-1, keepdims=True)
+
+
+# Line attribute holding each market's columns
+LINE_MARKETS = {
+    "ps": ("away_spread", "home_spread", "away_price", "home_price"),
+    "money": ("away_money", "home_money", "draw_money"),
+    "total": ("total", "over_price", "under_price"),
+}
+
+
+def _line_columns(line):
+    """Returns the market columns of a Line by name, with None
+    for the columns of a market the line does not quote.
+    """
+    columns = {}
+    for source, names in LINE_MARKETS.items():
+        market = getattr(line, source)
+        for name in names:
+            columns[name] = getattr(market, name, None) if market is not None else None
+    return columns
+
+
+def latest_lines(lines):
+    """Returns the most recent line for each (event, period,
+    sportsbook): the "current" line over "previous" ones, then
+    the one with the latest time, then the last one in the feed.
+    Lines keep the order in which their key first appears.
+    """
+    latest = {}
+    for line in lines:
+        event_id = line.event.id if line.event is not None else None
+        key = (event_id, line.period_id, line.sportsbook)
+        rank = (line.type == "current",
+                line.time if isinstance(line.time, datetime) else datetime.min)
+        if key not in latest or rank >= latest[key][0]:
+            latest[key] = (rank, line)
+    return [line for _, line in latest.values()]
+
+
+class OddsBoard(object):
+    """Columnar view of a list of Line objects for batch
+    analytics. Prices are stored as float arrays (NaN when
+    missing) with one row per line, and lines are grouped
+    by (event id, period id) so the best price and consensus
+    for each market can be computed across sportsbooks. Only
+    the latest line of each sportsbook is kept (see
+    latest_lines()).
+    """
+
+    # Price columns for each side of a market
+    MARKETS = {
+        "money": ("away_money", "home_money", "draw_money"),
+        "spread": ("away_price", "home_price"),
+        "total": ("over_price", "under_price"),
+    }
+    # Point columns for each side of a market
+    POINTS = {
+        "spread": ("away_spread", "home_spread"),
+        "total": ("total", "total"),
+    }
+
+    def __init__(self, lines):
+        super().__init__()
+        np = _import_numpy()
+        columns = {}
+        for market, names in self.MARKETS.items():
+            for name in names + self.POINTS.get(market, ()):
+                columns[(market, name)] = []
+        event_ids = []
+        period_ids = []
+        sportsbooks = []
+        groups = []
+        group_index = {}
+        for line in latest_lines(lines):
+            event_id = line.event.id if line.event is not None else None
+            key = (event_id, line.period_id)
+            if key not in group_index:
+                group_index[key] = len(group_index)
+            event_ids.append(event_id)
+            period_ids.append(line.period_id)
+            sportsbooks.append(line.sportsbook)
+            groups.append(group_index[key])
+            line_columns = _line_columns(line)
+            for (market, name), values in columns.items():
+                value = line_columns[name]
+                values.append(float(value) if value is not None else np.nan)
+
+        self.event_id = np.array(event_ids, dtype=object)
+        self.period_id = np.array(period_ids, dtype=object)
+        self.sportsbook = np.array(sportsbooks, dtype=object)
+        self.group = np.array(groups, dtype=np.intp)
+        self.group_keys = list(group_index)
+        self.columns = {k: np.array(v, dtype=float) for k, v in columns.items()}
+
+    @classmethod
+    def from_lines(cls, lines):
+        return cls(lines)
+
+    def __len__(self):
+        return len(self.group)
+
+    def _check_market(self, market):
+        if market not in self.MARKETS:
+            raise ValueError("market must be one of {}".format(
+                ", ".join(sorted(self.MARKETS))))
+
+    def prices(self, market):
+        """Returns a (lines, sides) array of American prices."""
+        np = _import_numpy()
+        self._check_market(market)
+        names = self.MARKETS[market]
+        prices = np.column_stack([self.columns[(market, n)] for n in names])
+        return np.where(prices == 0, np.nan, prices)
+
+    def points(self, market):
+        """Returns a (lines, sides) array of spread or total points."""
+        np = _import_numpy()
+        self._check_market(market)
+        names = self.POINTS.get(market)
+        if names is None:
+            return np.full((len(self), 2), np.nan)
+        return np.column_stack([self.columns[(market, n)] for n in names])
+
+    def implied_probabilities(self, market):
+        return implied_probability(self.prices(market))
+
+    def hold(self, market):
+        """Returns the bookmaker margin (overround) per line."""
+        np = _import_numpy()
+        return np.nansum(self.implied_probabilities(market), axis=1) - 1
+
+    def fair_probabilities(self, market):
+        """Returns no-vig probabilities per line and side."""
+        return no_vig(self.implied_probabilities(market))
+
+    def fair_prices(self, market):
+        """Returns no-vig American prices per line and side."""
+        return probability_to_american(self.fair_probabilities(market))
+
+    def best(self, market):
+        """Returns the best available price for each side of
+        each (event, period) group across all sportsbooks.
+
+        The result is a dict of group `keys`, a (groups, sides)
+        array of `price` and matching `point` values and a
+        (groups, sides) object array of `sportsbook` ids. Spread
+        and total prices are compared regardless of their point.
+        """
+        np = _import_numpy()
+        prices = self.prices(market)
+        points = self.points(market)
+        decimal = american_to_decimal(prices)
+        decimal = np.where(np.isnan(decimal), -np.inf, decimal)
+        groups = len(self.group_keys)
+        sides = prices.shape[1]
+        best_price = np.full((groups, sides), np.nan)
+        best_point = np.full((groups, sides), np.nan)
+        best_book = np.full((groups, sides), None, dtype=object)
+        for side in range(sides):
+            # Sort by group, then by best decimal odds first so
+            # the first row of each group is the best price.
+            order = np.lexsort((-decimal[:, side], self.group))
+            first = order[np.r_[True, np.diff(self.group[order]) != 0]] if len(order) else order
+            found = np.isfinite(decimal[first, side])
+            g = self.group[first][found]
+            rows = first[found]
+            best_price[g, side] = prices[rows, side]
+            best_point[g, side] = points[rows, min(side, points.shape[1] - 1)]
+            best_book[g, side] = self.sportsbook[rows]
+        return {"keys": list(self.group_keys), "price": best_price,
+                "point": best_point, "sportsbook": best_book}
+
+    def consensus(self, market):
+        """Returns the consensus for each (event, period) group:
+        the mean no-vig probability across sportsbooks for each
+        side, the matching fair American price, the mean point
+        and the number of books quoting the market.
+        """
+        np = _import_numpy()
+        fair = self.fair_probabilities(market)
+        points = self.points(market)
+        groups = len(self.group_keys)
+        quoted = ~np.isnan(fair)
+        totals = np.zeros((groups, fair.shape[1]))
+        counts = np.zeros((groups, fair.shape[1]))
+        np.add.at(totals, self.group, np.where(quoted, fair, 0))
+        np.add.at(counts, self.group, quoted)
+        point_totals = np.zeros((groups, points.shape[1]))
+        point_counts = np.zeros((groups, points.shape[1]))
+        np.add.at(point_totals, self.group, np.nan_to_num(points))
+        np.add.at(point_counts, self.group, ~np.isnan(points))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            probability = totals / counts
+            point = point_totals / point_counts
+        return {"keys": list(self.group_keys), "probability": probability,
+                "price": probability_to_american(probability),
+                "point": point, "books": counts.max(axis=1).astype(int)}
+
+
+### SHARED ODDS BOARD ###
+
+class SharedOddsBoard(object):
+    """Fixed-layout odds board in shared memory, written by
+    one publisher process and read by any number of reader
+    processes without HTTP calls, locks or copies.
+
+    Each Line becomes one record keyed by (event_id,
+    sportsbook, period_id), with the spread, moneyline and
+    total markets as columns (NaN when a market is missing).
+    Records are kept sorted by key. The board has two slots: the
+    publisher writes into the inactive slot and then flips the
+    active one. Each slot has a generation counter that is odd
+    while it is being written (a seqlock), so a reader can tell
+    whether the records it is looking at are still intact.
+
+    Requires numpy.
+    """
+    # int64 header fields
+    HEADER = ("capacity", "version", "active", "count0", "count1",
+              "generation0", "generation1", "published")
+    RECORD_FIELDS = [
+        ("event_id", "S24"), ("sportsbook", "S16"), ("period_id", "i4"),
+        ("away_rot", "i4"), ("home_rot", "i4"), ("time", "f8"),
+    ] + [(name, "f8") for names in LINE_MARKETS.values() for name in names]
+    EPOCH = datetime(1970, 1, 1)
+
+    def __init__(self, name=None, capacity=None, create=False):
+        super().__init__()
+        np = _import_numpy()
+        from multiprocessing import shared_memory
+        self.dtype = np.dtype(self.RECORD_FIELDS)
+        header_size = len(self.HEADER) * 8
+        if create:
+            if not capacity or capacity <= 0:
+                raise ValueError("capacity must be greater than zero")
+            size = header_size + 2 * capacity * self.dtype.itemsize
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self._created.add(self._shm.name)
+        else:
+            self._shm = self._attach(shared_memory, name)
+        self.name = self._shm.name
+        self.owner = create
+        self._header = np.ndarray((len(self.HEADER),), dtype=np.int64,
+                                  buffer=self._shm.buf)
+        if create:
+            self._header[:] = 0
+            self._header[0] = capacity
+        self.capacity = int(self._header[0])
+        self._slots = np.ndarray((2, self.capacity), dtype=self.dtype,
+                                 buffer=self._shm.buf, offset=header_size)
+
+    # Names of boards created by this process (and inherited
+    # by forked children, which share its resource tracker).
+    _created = set()
+
+    # Readers attach without registering the segment with the
+    # resource tracker, which would otherwise unlink it when
+    # the reader process exits.
+    @classmethod
+    def _attach(cls, shared_memory, name):
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name)
+            if shm.name not in cls._created:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(shm._name, "shared_memory")
+            return shm
+
+    @classmethod
+    def create(cls, name=None, capacity=20000):
+        """Creates a new board. Called by the publisher."""
+        return cls(name=name, capacity=capacity, create=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Attaches to an existing board. Called by readers."""
+        return cls(name=name)
+
+    def _field(self, name):
+        return self.HEADER.index(name)
+
+    @property
+    def version(self):
+        return int(self._header[self._field("version")])
+
+    def _records(self, lines):
+        np = _import_numpy()
+        lines = latest_lines(lines)
+        records = np.zeros(len(lines), dtype=self.dtype)
+        for name in self.dtype.names[5:]:
+            records[name] = np.nan
+        for i, line in enumerate(lines):
+            record = records[i]
+            record["event_id"] = str(line.event.id if line.event is not None else "").encode()
+            record["sportsbook"] = str(line.sportsbook or "").encode()
+            record["period_id"] = line.period_id if isinstance(line.period_id, int) else -1
+            record["away_rot"] = line.away_rot if isinstance(line.away_rot, int) else -1
+            record["home_rot"] = line.home_rot if isinstance(line.home_rot, int) else -1
+            if isinstance(line.time, datetime):
+                record["time"] = (line.time - self.EPOCH).total_seconds()
+            for name, value in _line_columns(line).items():
+                if value is not None:
+                    record[name] = float(value)
+        return records[np.lexsort((records["period_id"], records["sportsbook"],
+                                   records["event_id"]))]
+
+    def publish(self, lines):
+        """Replaces the board with the given lines."""
+        records = self._records(lines)
+        if len(records) > self.capacity:
+            raise ValueError(
+                "{} records do not fit on a board with capacity {}".format(
+                    len(records), self.capacity))
+        header = self._header
+        slot = 1 - int(header[self._field("active")])
+        generation = self._field("generation{}".format(slot))
+        header[generation] += 1
+        self._slots[slot][:len(records)] = records
+        header[self._field("count{}".format(slot))] = len(records)
+        header[generation] += 1
+        header[self._field("active")] = slot
+        header[self._field("published")] = int(time.time() * 1000)
+        header[self._field("version")] += 1
+        return header[self._field("version")]
+
+    def snapshot(self):
+        """Returns a BoardSnapshot of the active slot. The records
+        are a view into shared memory, not a copy.
+        """
+        header = self._header
+        while True:
+            version = int(header[self._field("version")])
+            slot = int(header[self._field("active")])
+            generation = int(header[self._field("generation{}".format(slot))])
+            count = int(header[self._field("count{}".format(slot))])
+            published = int(header[self._field("published")])
+            if generation % 2 == 0 and version == int(header[self._field("version")]):
+                break
+        return BoardSnapshot(self, slot, generation, version,
+                             self._slots[slot][:count], published / 1000.0)
+
+    def close(self):
+        self._header = None
+        self._slots = None
+        self._shm.close()
+
+    def unlink(self):
+        """Removes the shared memory segment. Called by the publisher."""
+        self._shm.unlink()
+
+
+class BoardSnapshot(object):
+    """Zero-copy view of one published version of a
+    SharedOddsBoard. The records stay intact until the
+    publisher writes into the same slot again, which
+    valid() detects; copy() detaches them from shared memory.
+    """
+
+    def __init__(self, board, slot, generation, version, records, published):
+        super().__init__()
+        self._board = board
+        self._slot = slot
+        self._generation = generation
+        self.version = version
+        self.records = records
+        self.published = published
+
+    def __len__(self):
+        return len(self.records)
+
+    def valid(self):
+        header = self._board._header
+        field = self._board._field("generation{}".format(self._slot))
+        return int(header[field]) == self._generation
+
+    def copy(self):
+        """Returns a copy of the records, or raises
+        StaleSnapshotError if they were overwritten meanwhile.
+        """
+        records = self.records.copy()
+        if not self.valid():
+            raise StaleSnapshotError(
+                "The board was republished while the snapshot was copied")
+        return records
+
+    def lookup(self, event_id, sportsbook=None, period_id=None):
+        """Returns the records for an event, optionally
+        limited to one sportsbook and period.
+        """
+        np = _import_numpy()
+        records = self.records
+        key = str(event_id).encode()
+        start = np.searchsorted(records["event_id"], key, side="left")
+        end = np.searchsorted(records["event_id"], key, side="right")
+        found = records[start:end]
+        if sportsbook is not None:
+            found = found[found["sportsbook"] == str(sportsbook).encode()]
+        if period_id is not None:
+            found = found[found["period_id"] == period_id]
+        return found
+
+
+class OddsBoardPublisher(object):
+    """Polls the odds feed for a set of leagues and publishes
+    the combined lines to a SharedOddsBoard.
+    """
+
+    def __init__(self, donbest, board, league_ids, interval=5.0):
+        super().__init__()
+        self._donbest = donbest
+        self.board = board
+        self.league_ids = list(league_ids)
+        self.interval = interval
+
+    def poll_once(self):
+        lines = []
+        for league_id in self.league_ids:
+            try:
+                lines.extend(self._donbest.odds(league_id=league_id))
+            except (ConnectionClosedError, EmptyResponseError):
+                pass
+        return self.board.publish(lines)
+
+    def run(self, stop_event=None):
+        """Polls until stop_event is set."""
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            self.poll_once()
+            stop_event.wait(self.interval)
+
+
+### POLL SCHEDULER ###
+
+# Feed dates are parsed as naive UTC datetimes, so
+# the schedulers and boards compare against the same.
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# States in which an event is over and no longer live
+FINAL_EVENT_STATES = ("final", "cancelled", "canceled", "postponed", "suspended")
+# How long after its start an event counts as live
+LIVE_WINDOW = timedelta(hours=4)
+
+
+class PollScheduler(object):
+    """Polls odds() per league and score() at rates that follow
+    the state of the scheduled events, refreshing the schedule
+    feed periodically to pick up changes.
+
+    Each event gets an interval: `live_interval` once it has
+    started, until `live_window` has passed (or for as long as
+    it is flagged live), and before that the interval of the first
+    entry in `tiers` whose window contains its start time.
+    Finished events, and events starting beyond the last
+    tier, are not polled. A league is polled at the shortest
+    interval of its events and paused when it has none; the
+    score feed follows the shortest interval of any event.
+    If the combined rate would exceed `budget` requests per
+    minute, every interval is stretched by the same factor.
+
+    `clock` returns the current naive UTC datetime and `sleep`
+    (which defaults to waiting on the stop event) waits a number
+    of seconds, so tests can run the scheduler on a simulated
+    clock by calling tick().
+    """
+    FINAL_STATES = FINAL_EVENT_STATES
+    DEFAULT_TIERS = ((timedelta(hours=1), 30),
+                     (timedelta(hours=24), 300),
+                     (timedelta(days=7), 1800))
+
+    def __init__(self, donbest, league_ids=None, budget=60, live_interval=5,
+                 live_window=LIVE_WINDOW, tiers=DEFAULT_TIERS,
+                 schedule_interval=900, schedule_endpoint="current_schedule",
+                 callback=None, clock=None, sleep=None):
+        super().__init__()
+        self._donbest = donbest
+        self.league_ids = None if league_ids is None else set(str(l) for l in league_ids)
+        self.budget = budget
+        self.live_interval = live_interval
+        self.live_window = live_window
+        self.tiers = tuple(tiers)
+        self.schedule_interval = schedule_interval
+        self.schedule_endpoint = schedule_endpoint
+        self.callback = callback
+        self.clock = clock or _utcnow
+        self.sleep = sleep
+        self.events = []
+        self.errors = {}
+        self.intervals = {}
+        self._next = {("schedule",): self.clock()}
+        self._last = {}
+
+    def event_interval(self, event, now=None):
+        """Returns the poll interval in seconds for an event,
+        or None if it does not need polling.
+        """
+        now = now or self.clock()
+        state = (event.event_state or "").lower()
+        if state in self.FINAL_STATES:
+            return None
+        start = event.date or event.opentime
+        if start is None:
+            return None
+        # `live` only says in-play betting is offered, so it just
+        # keeps a started game live past the live window.
+        if start <= now:
+            if event.live or now - start <= self.live_window:
+                return self.live_interval
+            return None
+        for window, interval in self.tiers:
+            if start - now <= window:
+                return interval
+        return None
+
+    def plan(self, now=None):
+        """Recomputes the interval of every task from the
+        current schedule and the request budget.
+        """
+        now = now or self.clock()
+        intervals = {("schedule",): self.schedule_interval}
+        for event in self.events:
+            league = event.league.id if event.league is not None else None
+            if league is None or (self.league_ids is not None and league not in self.league_ids):
+                continue
+            interval = self.event_interval(event, now)
+            if interval is None:
+                continue
+            for key in (("odds", league), ("score",)):
+                if key not in intervals or interval < intervals[key]:
+                    intervals[key] = interval
+
+        per_minute = sum(60.0 / i for i in intervals.values())
+        if self.budget and per_minute > self.budget:
+            factor = per_minute / self.budget
+            intervals = {k: i * factor for k, i in intervals.items()}
+
+        for key in list(self._next):
+            if key not in intervals:
+                del self._next[key]
+        for key, interval in intervals.items():
+            due = self._last[key] + timedelta(seconds=interval) if key in self._last else now
+            if key not in self._next or due < self._next[key]:
+                self._next[key] = due
+        self.intervals = intervals
+        return intervals
+
+    def next_due(self):
+        return min(self._next.values()) if self._next else None
+
+    def _run_task(self, key):
+        kind = key[0]
+        if kind == "schedule":
+            result = self._donbest.call(self.schedule_endpoint)
+            self.events = result
+        elif kind == "odds":
+            result = self._donbest.odds(league_id=key[1])
+        else:
+            result = self._donbest.score()
+        if self.callback is not None:
+            self.callback(key, result)
+        return result
+
+    def tick(self):
+        """Runs every task that is due and returns their keys."""
+        now = self.clock()
+        due = sorted((when, key) for key, when in self._next.items() if when <= now)
+        ran = []
+        for _, key in due:
+            try:
+                self._run_task(key)
+                self.errors.pop(key, None)
+            except (ConnectionClosedError, EmptyResponseError):
+                pass
+            except Exception as e:
+                self.errors[key] = e
+            self._last[key] = now
+            interval = self.intervals.get(key, self.schedule_interval)
+            self._next[key] = now + timedelta(seconds=interval)
+            ran.append(key)
+        if ran:
+            self.plan(now)
+        return ran
+
+    def run(self, stop_event=None):
+        """Polls until stop_event is set."""
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            self.tick()
+            wait = (self.next_due() - self.clock()).total_seconds()
+            if wait > 0:
+                if self.sleep is not None:
+                    self.sleep(wait)
+                else:
+                    stop_event.wait(wait)
+
+
+### BACKFILL ###
+
+class BackfillRunner(object):
+    """Resumable bulk download of opening/closing lines and
+    final scores for a set of leagues.
+
+    Work is split into units: one per (endpoint, league) for
+    the lines feeds and one per event for scores. Units run
+    on a bounded thread pool and every finished unit is
+    appended to a journal in `directory`, so an interrupted
+    backfill picks up where it stopped without refetching.
+    Events that appear in several feeds are only scored once.
+    """
+    JOURNAL = "journal.jsonl"
+
+    LINE_COLUMNS = ["endpoint", "event_id", "league_id", "event_date",
+                    "sportsbook", "period_id", "period", "type", "time",
+                    "away_rot", "home_rot"] + [
+                        name for names in LINE_MARKETS.values() for name in names]
+    SCORE_COLUMNS = ["event_id", "league_id", "away_rot", "home_rot",
+                     "away_score", "home_score", "description", "period",
+                     "period_id", "time"]
+
+    def __init__(self, donbest, league_ids, directory, endpoints=("open", "close"),
+                 scores=True, start=None, end=None, max_workers=4):
+        super().__init__()
+        self._donbest = donbest
+        self.league_ids = [str(l) for l in league_ids]
+        self.directory = directory
+        self.endpoints = list(endpoints)
+        self.scores = scores
+        self.start = start
+        self.end = end
+        self.max_workers = max_workers
+        self.failures = {}
+        self._lock = threading.Lock()
+        self._done = {}
+        self._events = {}
+        os.makedirs(directory, exist_ok=True)
+        self._load_journal()
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.directory, self.JOURNAL)
+
+    # Replays the journal written by previous runs. A partially
+    # written last line (from a crash) is ignored.
+    def _load_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path) as f:
+            for raw in f:
+                try:
+                    entry = json.loads(raw)
+                except ValueError:
+                    continue
+                unit = tuple(entry["unit"])
+                self._done[unit] = entry["rows"]
+                for event_id, league_id in entry.get("events", []):
+                    self._events.setdefault(event_id, league_id)
+
+    def _record(self, unit, rows, events=()):
+        entry = {"unit": list(unit), "rows": rows, "events": list(events)}
+        data = json.dumps(entry, default=self._json_default) + "\n"
+        with self._lock:
+            with open(self.journal_path, "a") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._done[unit] = json.loads(data)["rows"]
+            for event_id, league_id in events:
+                self._events.setdefault(event_id, league_id)
+
+    @staticmethod
+    def _json_default(value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return float(value)
+        raise TypeError("{!r} is not JSON serializable".format(value))
+
+    def _in_range(self, date):
+        if date is None:
+            return self.start is None and self.end is None
+        if self.start is not None and date < self.start:
+            return False
+        if self.end is not None and date >= self.end:
+            return False
+        return True
+
+    def plan(self):
+        """Returns the work units that still need to run. Score
+        units are only known once the lines units are done.
+        """
+        units = [("lines", endpoint, league_id)
+                 for endpoint in self.endpoints
+                 for league_id in self.league_ids]
+        if self.scores:
+            units += [("score", event_id) for event_id in sorted(self._events)]
+        return [u for u in units if u not in self._done]
+
+    def _run_lines(self, unit):
+        _, endpoint, league_id = unit
+        try:
+            lines = self._donbest.call(endpoint, league_id=league_id)
+        except (ConnectionClosedError, EmptyResponseError):
+            lines = []
+        rows = []
+        events = set()
+        seen = set()
+        for line in lines:
+            event = line.event
+            if not self._in_range(event.date):
+                continue
+            key = (event.id, line.sportsbook, line.period_id, line.type)
+            if key in seen:
+                continue
+            seen.add(key)
+            events.add((event.id, league_id))
+            row = {
+                "endpoint": endpoint, "event_id": event.id,
+                "league_id": league_id, "event_date": event.date,
+                "sportsbook": line.sportsbook, "period_id": line.period_id,
+                "period": line.period, "type": line.type, "time": line.time,
+                "away_rot": line.away_rot, "home_rot": line.home_rot,
+            }
+            row.update(_line_columns(line))
+            rows.append(row)
+        self._record(unit, rows, sorted(events))
+
+    def _run_score(self, unit):
+        _, event_id = unit
+        try:
+            scores = self._donbest.score(event_id=event_id)
+        except (ConnectionClosedError, EmptyResponseError):
+            scores = []
+        if not isinstance(scores, list):
+            scores = [scores]
+        rows = []
+        for score in scores:
+            if score.id != event_id:
+                continue
+            row = {c: getattr(score, c, None) for c in self.SCORE_COLUMNS}
+            row["league_id"] = score.league_id or self._events.get(event_id)
+            rows.append(row)
+        self._record(unit, rows)
+
+    def _run_units(self, units):
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {}
+            for unit in units:
+                runner = self._run_lines if unit[0] == "lines" else self._run_score
+                futures[pool.submit(runner, unit)] = unit
+            for future, unit in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    self.failures[unit] = e
+
+    def run(self):
+        """Runs every pending unit, lines first and then scores
+        for the events they found. Failed units are collected in
+        `failures` and retried on the next run.
+        """
+        self.failures = {}
+        self._run_units([u for u in self.plan() if u[0] == "lines"])
+        if self.scores:
+            self._run_units([u for u in self.plan() if u[0] == "score"])
+        return self
+
+    def _table(self, kind):
+        rows = []
+        for unit in sorted(self._done):
+            if unit[0] == kind:
+                rows.extend(self._done[unit])
+        return rows
+
+    @property
+    def line_rows(self):
+        return self._table("lines")
+
+    @property
+    def score_rows(self):
+        return self._table("score")
+
+    def columns(self, kind="lines"):
+        """Returns the collected rows as a dict of column lists."""
+        names = self.LINE_COLUMNS if kind == "lines" else self.SCORE_COLUMNS
+        rows = self._table(kind)
+        return {name: [row.get(name) for row in rows] for name in names}
+
+    def write(self, format="parquet"):
+        """Writes lines and scores to `directory` as Parquet
+        (requires pyarrow) or CSV files and returns their paths.
+        """
+        paths = []
+        for kind in ("lines", "score"):
+            data = self.columns(kind)
+            path = os.path.join(self.directory, "{}.{}".format(kind, format))
+            if format == "parquet":
+                try:
+                    import pyarrow
+                    import pyarrow.parquet
+                except ImportError as e:
+                    raise ImportError(
+                        "Writing Parquet requires pyarrow. Install it with "
+                        "`pip install pyarrow` or use format='csv'.") from e
+                pyarrow.parquet.write_table(pyarrow.table(data), path)
+            elif format == "csv":
+                import csv
+                with open(path, "w", newline="") as f:
+                    writer = csv.writer(f)
+                    writer.writerow(list(data))
+                    writer.writerows(zip(*data.values()))
+            else:
+                raise ValueError("format must be 'parquet' or 'csv'")
+            paths.append(path)
+        return paths
+
+
+### SCHEDULE STORE ###
+
+class ScheduleStore(object):
+    """Local SQLite index of the schedule, lookup, odds and
+    score feeds so they can be joined without network calls.
+
+    Feeds are ingested with the ingest_* methods (which
+    upsert by id) and queried with the helpers below or with
+    query() for arbitrary SQL. Pass a file path to keep the
+    store between runs; the default is an in-memory database.
+    """
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS leagues (
+        id TEXT PRIMARY KEY, name TEXT, abbreviation TEXT,
+        sport_id TEXT, sport_name TEXT);
+    CREATE TABLE IF NOT EXISTS teams (
+        id TEXT PRIMARY KEY, league_id TEXT, name TEXT,
+        abbreviation TEXT, full_name TEXT, information TEXT);
+    CREATE TABLE IF NOT EXISTS locations (
+        id TEXT PRIMARY KEY, name TEXT, stadium_type TEXT,
+        surface_type TEXT, seating_capacity INTEGER, elevation INTEGER,
+        city TEXT, state TEXT, country TEXT);
+    CREATE TABLE IF NOT EXISTS events (
+        id TEXT PRIMARY KEY, league_id TEXT, season TEXT, date TEXT,
+        day TEXT, opentime TEXT, name TEXT, event_type TEXT,
+        event_state TEXT, live INTEGER, neutral INTEGER,
+        game_number INTEGER, group_id TEXT, group_name TEXT,
+        location_id TEXT);
+    CREATE TABLE IF NOT EXISTS participants (
+        event_id TEXT, side TEXT, team_id TEXT, team_name TEXT,
+        rotation INTEGER, PRIMARY KEY (event_id, side));
+    CREATE TABLE IF NOT EXISTS lines (
+        event_id TEXT, sportsbook TEXT, period_id INTEGER, feed TEXT,
+        period TEXT, type TEXT, time TEXT, away_rot INTEGER,
+        home_rot INTEGER, away_spread REAL, home_spread REAL,
+        away_price INTEGER, home_price INTEGER, away_money INTEGER,
+        home_money INTEGER, draw_money INTEGER, total REAL,
+        over_price INTEGER, under_price INTEGER,
+        PRIMARY KEY (event_id, sportsbook, period_id, feed));
+    CREATE TABLE IF NOT EXISTS scores (
+        event_id TEXT PRIMARY KEY, league_id TEXT, away_rot INTEGER,
+        home_rot INTEGER, away_score INTEGER, home_score INTEGER,
+        description TEXT, period TEXT, period_id INTEGER, time TEXT);
+    CREATE INDEX IF NOT EXISTS events_league ON events (league_id, date);
+    CREATE INDEX IF NOT EXISTS events_day ON events (day);
+    CREATE INDEX IF NOT EXISTS events_live ON events (live, league_id);
+    CREATE INDEX IF NOT EXISTS participants_team ON participants (team_id);
+    CREATE INDEX IF NOT EXISTS participants_rotation ON participants (rotation);
+    CREATE INDEX IF NOT EXISTS teams_league ON teams (league_id);
+    CREATE INDEX IF NOT EXISTS lines_rotation ON lines (away_rot, home_rot);
+    CREATE INDEX IF NOT EXISTS scores_rotation ON scores (away_rot, home_rot);
+    """
+
+    # Decimal odds of an American price column, for ranking
+    DECIMAL_SQL = ("CASE WHEN {0} > 0 THEN 1 + {0} / 100.0 "
+                   "WHEN {0} < 0 THEN 1 + 100.0 / -{0} END")
+
+    def __init__(self, path=":memory:"):
+        super().__init__()
+        import sqlite3
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.executescript(self.SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    @staticmethod
+    def _value(value):
+        if isinstance(value, datetime):
+            return value.isoformat(sep=" ")
+        if isinstance(value, Decimal):
+            return float(value)
+        if isinstance(value, bool):
+            return int(value)
+        return value
+
+    def _upsert(self, table, rows, replace=True):
+        rows = list(rows)
+        if not rows:
+            return 0
+        columns = list(rows[0])
+        sql = "INSERT OR {} INTO {} ({}) VALUES ({})".format(
+            "REPLACE" if replace else "IGNORE", table,
+            ", ".join(columns), ", ".join("?" * len(columns)))
+        values = [[self._value(row[c]) for c in columns] for row in rows]
+        with self._lock, self._db:
+            self._db.executemany(sql, values)
+        return len(rows)
+
+    def _league_row(self, league):
+        sport = league.sport
+        return {"id": league.id, "name": league.name,
+                "abbreviation": league.abbreviation,
+                "sport_id": sport.id if sport is not None else None,
+                "sport_name": sport.name if sport is not None else None}
+
+    def ingest_schedule(self, events):
+        """Stores events from schedule(), current_schedule() or
+        schedule_inplay(), along with their participants and
+        leagues. Returns the number of events stored.
+        """
+        event_rows, participant_rows, leagues, locations = [], [], {}, {}
+        for event in events:
+            league = event.league
+            if league is not None:
+                leagues[league.id] = self._league_row(league)
+            group = event.group
+            location = event.location
+            if location is not None and location.id is not None:
+                locations[location.id] = {"id": location.id, "name": location.name}
+            event_rows.append({
+                "id": event.id, "league_id": league.id if league is not None else None,
+                "season": event.season, "date": event.date,
+                "day": event.date.date().isoformat() if event.date else None,
+                "opentime": event.opentime, "name": event.name,
+                "event_type": event.event_type, "event_state": event.event_state,
+                "live": event.live, "neutral": event.neutral,
+                "game_number": event.game_number,
+                "group_id": group.id if group is not None else None,
+                "group_name": group.name if group is not None else None,
+                "location_id": location.id if location is not None else None,
+            })
+            for team in event.participants or []:
+                if not isinstance(team, Team):
+                    continue
+                participant_rows.append({
+                    "event_id": event.id, "side": team.side, "team_id": team.id,
+                    "team_name": team.name, "rotation": _participant_rotation(team),
+                })
+        self._upsert("leagues", leagues.values())
+        # The schedule only has a location's id and name, so it
+        # must not overwrite rows from the location() feed.
+        self._upsert("locations", locations.values(), replace=False)
+        self._upsert("participants", participant_rows)
+        return self._upsert("events", event_rows)
+
+    def ingest_teams(self, teams):
+        """Stores teams from the team() lookup feed."""
+        rows, leagues = [], {}
+        for team in teams:
+            if team.league is not None:
+                leagues[team.league.id] = self._league_row(team.league)
+            rows.append({"id": team.id, "name": team.name,
+                         "league_id": team.league.id if team.league is not None else None,
+                         "abbreviation": team.abbreviation,
+                         "full_name": team.full_name,
+                         "information": team.information})
+        self._upsert("leagues", leagues.values())
+        return self._upsert("teams", rows)
+
+    def ingest_locations(self, locations):
+        """Stores stadiums from the location() lookup feed."""
+        rows = []
+        for location in locations:
+            city = location.city
+            rows.append({"id": location.id, "name": location.name,
+                         "stadium_type": location.stadium_type,
+                         "surface_type": location.surface_type,
+                         "seating_capacity": location.seating_capacity,
+                         "elevation": location.elevation,
+                         "city": city.name if city is not None else None,
+                         "state": city.state if city is not None else None,
+                         "country": city.country if city is not None else None})
+        return self._upsert("locations", rows)
+
+    def ingest_odds(self, lines, feed="odds"):
+        """Stores lines from odds(), open() or close(); `feed`
+        says which so opening and current lines are kept apart.
+        Only the latest line of each sportsbook is stored (see
+        latest_lines()).
+        """
+        rows = []
+        for line in latest_lines(lines):
+            row = {"event_id": line.event.id if line.event is not None else None,
+                   "sportsbook": line.sportsbook, "period_id": line.period_id,
+                   "feed": feed, "period": line.period, "type": line.type,
+                   "time": line.time, "away_rot": line.away_rot,
+                   "home_rot": line.home_rot}
+            row.update(_line_columns(line))
+            rows.append(row)
+        return self._upsert("lines", rows)
+
+    def ingest_scores(self, scores):
+        """Stores scores from the score() feed."""
+        rows = [{"event_id": score.id, "league_id": score.league_id,
+                 "away_rot": score.away_rot, "home_rot": score.home_rot,
+                 "away_score": score.away_score, "home_score": score.home_score,
+                 "description": score.description, "period": score.period,
+                 "period_id": score.period_id, "time": score.time}
+                for score in scores]
+        return self._upsert("scores", rows)
+
+    def query(self, sql, params=()):
+        """Runs a SQL query and returns the rows as dicts."""
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, params)]
+
+    def _best_price_sql(self, column, feed):
+        return ("(SELECT {c} FROM lines l WHERE l.event_id = e.id AND l.feed = '{feed}' "
+                "AND l.period_id = 1 AND {c} IS NOT NULL AND {c} != 0 "
+                "ORDER BY {d} DESC LIMIT 1)").format(
+                    c=column, feed=feed, d=self.DECIMAL_SQL.format(column))
+
+    def events(self, league=None, live=None, day=None, team_id=None, rotation=None,
+               now=None):
+        """Returns events joined with their teams, location and
+        current score, plus the best full-game moneyline across
+        sportsbooks. `league` is a league id or name.
+
+        An event is live once it has started (as of `now`, which
+        defaults to the current UTC time) and is not over: for
+        LIVE_WINDOW after its start, or for as long as the feed
+        flags it live. Before kickoff the live flag only means
+        in-play betting is offered.
+        """
+        sql = """
+            SELECT e.id, e.name, e.date, e.event_state, e.live,
+                   lg.id AS league_id, lg.name AS league,
+                   a.team_id AS away_team_id, a.team_name AS away_team,
+                   a.rotation AS away_rot, h.team_id AS home_team_id,
+                   h.team_name AS home_team, h.rotation AS home_rot,
+                   loc.name AS location, loc.city AS city,
+                   s.away_score, s.home_score, s.period, s.description,
+                   {best_away} AS best_away_money,
+                   {best_home} AS best_home_money
+            FROM events e
+            LEFT JOIN leagues lg ON lg.id = e.league_id
+            LEFT JOIN participants a ON a.event_id = e.id AND a.side = 'away'
+            LEFT JOIN participants h ON h.event_id = e.id AND h.side = 'home'
+            LEFT JOIN locations loc ON loc.id = e.location_id
+            LEFT JOIN scores s ON s.event_id = e.id
+        """.format(best_away=self._best_price_sql("away_money", "odds"),
+                   best_home=self._best_price_sql("home_money", "odds"))
+        where, params = [], []
+        if league is not None:
+            where.append("(lg.id = ? OR lg.name = ?)")
+            params += [str(league), str(league)]
+        if live is not None:
+            now = now or _utcnow()
+            live_sql = ("COALESCE(e.date <= ? AND (e.live = 1 OR e.date >= ?) "
+                        "AND LOWER(COALESCE(e.event_state, '')) NOT IN ({}), 0)").format(
+                            ", ".join("?" * len(FINAL_EVENT_STATES)))
+            where.append(live_sql if live else "NOT " + live_sql)
+            params += [self._value(now), self._value(now - LIVE_WINDOW)]
+            params += list(FINAL_EVENT_STATES)
+        if day is not None:
+            where.append("e.day = ?")
+            params.append(day.isoformat() if hasattr(day, "isoformat") else day)
+        if team_id is not None:
+            where.append("(a.team_id = ? OR h.team_id = ?)")
+            params += [str(team_id), str(team_id)]
+        if rotation is not None:
+            where.append("(a.rotation = ? OR h.rotation = ?)")
+            params += [rotation, rotation]
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY e.date, e.id"
+        return self.query(sql, params)
+
+    def live_events(self, league=None, now=None):
+        """Returns live events with their score and best line."""
+        return self.events(league=league, live=True, now=now)
+
+
+### ROTATION RESOLVER ###
+
+class RotationResolver(object):
+    """Index of (day, rotation number) -> (event, team) built
+    from schedule feeds, used to attach lines, scores and
+    period scores to their scheduled events in O(1).
+
+    Feed the resolver schedule events with update() as often
+    as they change; an event that moves to another day or
+    rotation number is re-indexed. Lookups that carry a date
+    use it directly, falling back to the event nearest in time
+    when nothing is scheduled for that rotation on that day.
+    When several events claim the same day and rotation, the
+    one indexed last wins until it is removed.
+    """
+
+    def __init__(self, events=()):
+        super().__init__()
+        self._claims = {}
+        self._days = {}
+        self._events = {}
+        self._event_keys = {}
+        self.update(events)
+
+    def __len__(self):
+        return len(self._event_keys)
+
+    @staticmethod
+    def _day(when):
+        if isinstance(when, datetime):
+            return when.date()
+        return when
+
+    # Drops an event's claims, handing each (day, rotation)
+    # back to any other event that still claims it.
+    def _discard(self, event_id):
+        self._events.pop(event_id, None)
+        for key in self._event_keys.pop(event_id, ()):
+            claims = [c for c in self._claims.get(key, ()) if c[0].id != event_id]
+            if claims:
+                self._claims[key] = claims
+                continue
+            self._claims.pop(key, None)
+            day, rotation = key
+            days = self._days.get(rotation)
+            if days is not None:
+                days.discard(day)
+                if not days:
+                    del self._days[rotation]
+
+    def update(self, events):
+        """Adds or re-indexes schedule events."""
+        for event in events:
+            self._discard(event.id)
+            start = event.date or event.opentime
+            day = self._day(start)
+            keys = []
+            for team in event.participants or []:
+                rotation = _participant_rotation(team)
+                if rotation is None:
+                    continue
+                key = (day, rotation)
+                self._claims.setdefault(key, []).append((event, team))
+                self._days.setdefault(rotation, set()).add(day)
+                keys.append(key)
+            self._events[event.id] = event
+            self._event_keys[event.id] = keys
+
+    def remove(self, event_id):
+        """Drops an event from the index."""
+        self._discard(event_id)
+
+    def resolve(self, rotation, when=None):
+        """Returns the (event, team) for a rotation number, or
+        None. `when` is the date or datetime of the event.
+        """
+        try:
+            rotation = int(rotation)
+        except (TypeError, ValueError):
+            return None
+        day = self._day(when)
+        if day is not None:
+            claims = self._claims.get((day, rotation))
+            if claims:
+                return claims[-1]
+        days = self._days.get(rotation)
+        if not days:
+            return None
+        dated = [d for d in days if d is not None]
+        if not dated:
+            return self._claims[(None, rotation)][-1]
+        if day is None:
+            return self._claims[(max(dated), rotation)][-1]
+        nearest = min(dated, key=lambda d: abs((d - day).days))
+        return self._claims[(nearest, rotation)][-1]
+
+    def event_for(self, rotation, when=None):
+        found = self.resolve(rotation, when)
+        return found[0] if found is not None else None
+
+    def team_for(self, rotation, when=None):
+        found = self.resolve(rotation, when)
+        return found[1] if found is not None else None
+
+    def attach_line(self, line):
+        """Returns the scheduled event for an odds Line."""
+        when = line.event.date if line.event is not None else None
+        return self.event_for(line.away_rot, when) or self.event_for(line.home_rot, when)
+
+    def attach_score(self, score):
+        """Returns the scheduled event for a Score. A score's id
+        is its event's id; when that event is not indexed the
+        rotation numbers are resolved by the score's update time,
+        since scores carry no event date.
+        """
+        event = self._events.get(score.id)
+        if event is not None:
+            return event
+        return self.event_for(score.away_rot, score.time) or \
+            self.event_for(score.home_rot, score.time)
+
+    def attach_period_scores(self, period, when=None):
+        """Returns (team, score) pairs for a Period's scores."""
+        return [(self.team_for(s.get("rot"), when or period.time), s)
+                for s in period.scores or []]
+
+
+### LIVE BOARD ###
+
+class LiveEvent(object):
+    """An in-play event with its current score and the
+    latest line of every sportsbook (see latest_lines()) from
+    one live board.
+    """
+
+    def __init__(self, event, score=None, lines=None):
+        super().__init__()
+        self.event = event
+        self.score = score
+        self.lines = lines if lines is not None else []
+
+    @property
+    def id(self):
+        return self.event.id
+
+    def __repr__(self):
+        return "<LiveEvent {} score={} lines={}>".format(
+            self.id, self.score is not None, len(self.lines))
+
+
+class LiveBoard(object):
+    """Snapshot of the in-play schedule joined by event id with
+    the score() feed and the odds() feeds of its leagues.
+
+    fetch() requests schedule_inplay() and score() together and
+    the odds of each league as soon as it is known, so a full
+    refresh takes two rounds of concurrent requests (one when
+    `league_ids` is given) instead of two requests per event.
+    `started` and `timestamp` are the naive UTC times the
+    refresh began and finished; every feed in the board was
+    requested between the two. Feeds that come back empty or
+    unauthorized are treated as having no data, any other
+    error is raised.
+    """
+
+    def __init__(self, events, scores=(), lines=(), started=None, timestamp=None):
+        super().__init__()
+        self.started = started
+        self.timestamp = timestamp
+        scores_by_event = {}
+        for score in scores:
+            scores_by_event[str(score.id)] = score
+        lines_by_event = {}
+        for line in latest_lines(lines):
+            if line.event is not None:
+                lines_by_event.setdefault(str(line.event.id), []).append(line)
+        self.events = {}
+        for event in events:
+            key = str(event.id)
+            self.events[key] = LiveEvent(
+                event, scores_by_event.get(key), lines_by_event.get(key, []))
+
+    @classmethod
+    def fetch(cls, donbest, league_ids=None, max_workers=None):
+        """Builds a board from concurrent requests made through
+        a Donbest client (or a DonbestPool).
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        if league_ids is not None:
+            league_ids = [str(l) for l in league_ids]
+        started = _utcnow()
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            schedule = pool.submit(cls._fetch, donbest, "schedule_inplay")
+            scores = pool.submit(cls._fetch, donbest, "score")
+            odds = {}
+            for league in league_ids or ():
+                odds[league] = pool.submit(cls._fetch, donbest, "odds", league_id=league)
+            events = []
+            for event in schedule.result():
+                league = event.league.id if event.league is not None else None
+                if league is None or (league_ids is not None and league not in league_ids):
+                    continue
+                if league not in odds:
+                    odds[league] = pool.submit(cls._fetch, donbest, "odds", league_id=league)
+                events.append(event)
+            scores = scores.result()
+            lines = [line for future in odds.values() for line in future.result()]
+        timestamp = _utcnow()
+        return cls(events, scores, lines, started=started, timestamp=timestamp)
+
+    @staticmethod
+    def _fetch(donbest, endpoint, **kwargs):
+        try:
+            result = donbest.call(endpoint, **kwargs)
+        except (ConnectionClosedError, EmptyResponseError):
+            return []
+        return result if isinstance(result, list) else [result]
+
+    def __len__(self):
+        return len(self.events)
+
+    def __iter__(self):
+        return iter(self.events.values())
+
+    def __contains__(self, event_id):
+        return str(event_id) in self.events
+
+    def __getitem__(self, event_id):
+        return self.events[str(event_id)]
+
+    def get(self, event_id, default=None):
+        return self.events.get(str(event_id), default)
+
+    @property
+    def age(self):
+        """Seconds since the board finished refreshing."""
+        return (_utcnow() - self.timestamp).total_seconds()
+
+    def __repr__(self):
+        return "<LiveBoard {} events at {}>".format(len(self), self.timestamp)
+
+
+### LONG-RUNNING MODE ###
+
+def _iter_models(value, seen=None):
+    """Yields every model reachable from a parsed result
+    (a model, or lists and dicts of models), children first.
+    """
+    if seen is None:
+        seen = set()
+    if isinstance(value, BaseDonbestResponse):
+        if id(value) in seen:
+            return
+        seen.add(id(value))
+        for key, child in vars(value).items():
+            if key not in ("node", "_donbest"):
+                yield from _iter_models(child, seen)
+        yield value
+    elif isinstance(value, (list, tuple)):
+        for child in value:
+            yield from _iter_models(child, seen)
+
+
+def _deep_sizeof(value, seen=None):
+    """Estimates the bytes held by a parsed result, counting
+    shared objects once and ignoring the client.
+    """
+    if seen is None:
+        seen = set()
+    if id(value) in seen or isinstance(value, Donbest):
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, BaseDonbestResponse):
+        size += _deep_sizeof(vars(value), seen)
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            if k != "_donbest":
+                size += _deep_sizeof(k, seen) + _deep_sizeof(v, seen)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            size += _deep_sizeof(v, seen)
+    return size
+
+
+class ModelPool(object):
+    """Bounded LRU of canonical model objects. Parsed objects
+    whose attributes are identical to one seen before (after
+    their children have been canonicalised) are replaced by
+    the pooled instance, so repeated polls share one object
+    graph for everything that did not change instead of
+    allocating a fresh one every cycle.
+    """
+
+    def __init__(self, maxsize=10000):
+        super().__init__()
+        from collections import OrderedDict
+        self.maxsize = maxsize
+        self._objects = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._objects)
+
+    @staticmethod
+    def _hashable(value):
+        if isinstance(value, dict):
+            return tuple(sorted(value.items()))
+        if isinstance(value, list):
+            return tuple(value)
+        return value
+
+    def _key(self, obj):
+        items = tuple((k, self._hashable(v)) for k, v in vars(obj).items()
+                      if k not in ("node", "_donbest"))
+        key = (type(obj), items)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def canonical(self, obj):
+        """Returns the pooled instance equal to obj, adding
+        obj to the pool if there is none.
+        """
+        key = self._key(obj)
+        if key is None:
+            return obj
+        with self._lock:
+            found = self._objects.get(key)
+            if found is not None:
+                self._objects.move_to_end(key)
+                self.hits += 1
+                return found
+            self.misses += 1
+            self._objects[key] = obj
+            if len(self._objects) > self.maxsize:
+                self._objects.popitem(last=False)
+            return obj
+
+    def clear(self):
+        with self._lock:
+            self._objects.clear()
+
+
+### TRANSPORT ###
+
+class Transport(object):
+    """Base object for the layer that performs HTTP requests
+    on behalf of the Donbest client. A transport only has to
+    implement get() and return an object exposing url,
+    status_code, headers, content, iter_content() and close(),
+    which requests.Response already does; error statuses are
+    raised by the client as HTTPStatusError. With stream=True
+    the body should not be read until iter_content() is called,
+    and errors raised while reading it should be TransportErrors.
+    """
+
+    def get(self, url, params=None, timeout=None, stream=False):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RequestsTransport(Transport):
+    """Default transport backed by a pooled requests.Session.
+    The requests library is imported when the session is first
+    used, not when the transport is created.
+    """
+
+    def __init__(self, session=None):
+        super().__init__()
+        self._http_session = session
+
+    @property
+    def session(self):
+        if self._http_session is None:
+            import requests
+            self._http_session = requests.Session()
+        return self._http_session
+
+    def get(self, url, params=None, timeout=None, stream=False):
+        import requests
+        try:
+            r = self.session.get(
+                url, params=params, timeout=timeout, stream=stream)
+            return _StreamedResponse(r) if stream else r
+        except requests.Timeout as e:
+            raise RequestTimeoutError(
+                "The request to {} timed out".format(url)) from e
+        except requests.ConnectionError as e:
+            raise TransportError(
+                "Could not connect to {}".format(url)) from e
+
+    def close(self):
+        if self._http_session is not None:
+            self._http_session.close()
+            self._http_session = None
+
+
+class _StreamedResponse(object):
+    """Wraps a streamed requests.Response so that errors raised
+    while its body is read surface as TransportErrors, the same
+    as errors raised while the request is sent.
+    """
+
+    def __init__(self, response):
+        super().__init__()
+        self._response = response
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def iter_content(self, chunk_size=1):
+        import requests
+        from urllib3.exceptions import ReadTimeoutError
+        try:
+            yield from self._response.iter_content(chunk_size)
+        except requests.Timeout as e:
+            raise RequestTimeoutError(
+                "Reading the response from {} timed out".format(self.url)) from e
+        except requests.RequestException as e:
+            # requests reports a read timeout on the body as
+            # a ConnectionError wrapping urllib3's exception.
+            if e.args and isinstance(e.args[0], ReadTimeoutError):
+                raise RequestTimeoutError(
+                    "Reading the response from {} timed out".format(self.url)) from e
+            raise TransportError(
+                "The connection to {} failed while reading the "
+                "response".format(self.url)) from e
+
+
+class FakeResponse(object):
+    """Minimal stand-in for requests.Response returned
+    by the FakeTransport.
+    """
+
+    def __init__(self, content=b"", status_code=200, url=None, headers=None):
+        super().__init__()
+        self.content = content
+        self.status_code = status_code
+        self.url = url
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeTransport(Transport):
+    """In-process transport that serves canned responses so
+    the client can be exercised without a network or token.
+
+    Routes are keyed by the path after Donbest.BASE_URL
+    (e.g. "odds/3/") or by the bare endpoint name, which
+    matches any request to that endpoint. A route value may
+    be bytes, a FakeResponse, an exception instance to raise
+    or a list of those which is served in order, repeating
+    the last item once the list is exhausted.
+    """
+
+    def __init__(self, routes=None):
+        super().__init__()
+        self.routes = dict(routes or {})
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def add(self, path, response):
+        self.routes[path] = response
+
+    def _next_response(self, path):
+        key = path if path in self.routes else path.split("/")[0]
+        if key not in self.routes:
+            return FakeResponse(status_code=404)
+        response = self.routes[key]
+        if isinstance(response, list):
+            if len(response) > 1:
+                response = response.pop(0)
+            else:
+                response = response[0]
+        return response
+
+    def get(self, url, params=None, timeout=None, stream=False):
+        path = url[len(Donbest.BASE_URL):] if url.startswith(Donbest.BASE_URL) else url
+        with self._lock:
+            self.calls.append((url, dict(params or {})))
+            response = self._next_response(path)
+        if isinstance(response, Exception):
+            raise response
+        if not isinstance(response, FakeResponse):
+            response = FakeResponse(content=response)
+        if response.url is None:
+            response = FakeResponse(
+                content=response.content, status_code=response.status_code,
+                url=url, headers=response.headers)
+        return response
+
+
+class CassetteTransport(Transport):
+    """Records the requests sent through another transport to a
+    gzip-compressed cassette file and replays them offline, so
+    tests and benchmarks run without a token or network.
+
+    In "record" mode requests go to `transport` (a new
+    RequestsTransport by default) and the URL, parameters,
+    status, headers, body and latency of each response are
+    kept until save() or close() writes the cassette (close()
+    writes nothing if no request was recorded, and leaving a
+    `with` block on an exception discards the recording). In
+    "replay" mode responses come from the cassette and a
+    request that was never recorded raises CassetteMissError.
+    "auto" replays an existing cassette and records otherwise.
+
+    Requests are matched on URL and parameters, leaving out
+    the API token. The token is never written: it is removed
+    from the recorded parameters and URLs, and cookie and
+    authorization headers are dropped. Repeated requests
+    are served in the order they were recorded, repeating the
+    last one once they run out. Replayed responses wait for
+    their recorded latency multiplied by `latency`, so 0 (the
+    default) replays instantly and 1 at recorded speed.
+    """
+    MODES = ("record", "replay", "auto")
+    VERSION = 1
+    REDACTED_PARAMS = ("token",)
+    REDACTED_HEADERS = ("set-cookie", "cookie", "authorization", "proxy-authorization")
+
+    def __init__(self, path, mode="auto", transport=None, latency=0.0,
+                 sleep=time.sleep):
+        super().__init__()
+        if mode not in self.MODES:
+            raise ValueError("mode must be one of {}".format(", ".join(self.MODES)))
+        if mode == "auto":
+            mode = "replay" if os.path.exists(path) else "record"
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.sleep = sleep
+        self.interactions = []
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._transport = None
+        if mode == "record":
+            self._transport = transport if transport is not None else RequestsTransport()
+        else:
+            self.load()
+
+    @classmethod
+    def _redact_url(cls, url):
+        from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+        if not url:
+            return url
+        parts = urlsplit(url)
+        query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                 if k not in cls.REDACTED_PARAMS]
+        return urlunsplit(parts._replace(query=urlencode(query)))
+
+    @classmethod
+    def _key(cls, url, params):
+        return (cls._redact_url(url),) + tuple(sorted(
+            (k, str(v)) for k, v in (params or {}).items()
+            if k not in cls.REDACTED_PARAMS))
+
+    def load(self):
+        """Reads the cassette and resets the replay order."""
+        import gzip
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            cassette = json.load(f)
+        if cassette.get("version") != self.VERSION:
+            raise ValueError("Unsupported cassette version {}".format(
+                cassette.get("version")))
+        with self._lock:
+            self.interactions = cassette["interactions"]
+            self._queues = {}
+            for interaction in self.interactions:
+                key = self._key(interaction["url"], interaction["params"])
+                self._queues.setdefault(key, []).append(interaction)
+
+    def save(self):
+        """Writes the recorded interactions to the cassette."""
+        import gzip
+        with self._lock:
+            cassette = {"version": self.VERSION, "interactions": list(self.interactions)}
+        with gzip.open(self.path, "wt", encoding="utf-8") as f:
+            json.dump(cassette, f)
+
+    def get(self, url, params=None, timeout=None, stream=False):
+        if self.mode == "record":
+            return self._record(url, params, timeout)
+        return self._replay(url, params)
+
+    def _record(self, url, params, timeout):
+        import base64
+        start = time.perf_counter()
+        r = self._transport.get(url, params=params, timeout=timeout, stream=True)
+        try:
+            content = b"".join(r.iter_content(Donbest.CHUNK_SIZE))
+        finally:
+            r.close()
+        elapsed = time.perf_counter() - start
+        interaction = {
+            "url": self._redact_url(url),
+            "params": {k: str(v) for k, v in (params or {}).items()
+                       if k not in self.REDACTED_PARAMS},
+            "status_code": r.status_code,
+            "response_url": self._redact_url(r.url),
+            "headers": {k: v for k, v in r.headers.items()
+                        if k.lower() not in self.REDACTED_HEADERS},
+            "body": base64.b64encode(content).decode("ascii"),
+            "elapsed": elapsed,
+        }
+        with self._lock:
+            self.interactions.append(interaction)
+        return FakeResponse(content=content, status_code=r.status_code,
+                            url=r.url, headers=dict(r.headers))
+
+    def _replay(self, url, params):
+        import base64
+        with self._lock:
+            queue = self._queues.get(self._key(url, params))
+            if not queue:
+                raise CassetteMissError(
+                    "No recorded response for {} with parameters {} in "
+                    "{}".format(url, self._key(url, params)[1:], self.path))
+            interaction = queue.pop(0) if len(queue) > 1 else queue[0]
+        if self.latency:
+            self.sleep(interaction["elapsed"] * self.latency)
+        return FakeResponse(
+            content=base64.b64decode(interaction["body"]),
+            status_code=interaction["status_code"],
+            url=interaction["response_url"], headers=interaction["headers"])
+
+    def latencies(self):
+        """Returns the recorded latencies in seconds per endpoint."""
+        with self._lock:
+            interactions = list(self.interactions)
+        latencies = {}
+        for interaction in interactions:
+            url = interaction["url"]
+            path = url[len(Donbest.BASE_URL):] if url.startswith(Donbest.BASE_URL) else url
+            latencies.setdefault(path.split("/")[0], []).append(interaction["elapsed"])
+        return latencies
+
+    def close(self):
+        if self.mode == "record":
+            # An empty cassette would make every later "auto"
+            # run replay it and miss, so nothing is written.
+            if self.interactions:
+                self.save()
+            self._transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self.mode == "record":
+            self._transport.close()
+        else:
+            self.close()
+
+
+class RetryPolicy(object):
+    """Retries failed requests with jittered exponential backoff.
+    Connection errors, timeouts and the status codes in
+    RETRY_STATUSES are retried up to max_retries times.
+    """
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, max_retries=2, backoff_factor=0.5, max_backoff=30.0,
+                 jitter=True, statuses=None, sleep=time.sleep):
+        super().__init__()
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = tuple(statuses) if statuses is not None else self.RETRY_STATUSES
+        self.sleep = sleep
+
+    def backoff(self, attempt, retry_after=None):
+        """Returns the number of seconds to wait before
+        the given retry attempt (starting at 0).
+        """
+        if retry_after is not None:
+            try:
+                return min(self.max_backoff, float(retry_after))
+            except ValueError:
+                pass
+        delay = min(self.max_backoff, self.backoff_factor * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+
+class RateLimiter(object):
+    """Thread-safe token bucket. A single instance can be
+    shared between clients and threads to keep the combined
+    request rate under `rate` requests per second, allowing
+    bursts of up to `burst` requests.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        super().__init__()
+        if rate <= 0:
+            raise ValueError("rate must be greater than zero")
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+
+    def try_acquire(self, tokens=1):
+        """Takes tokens from the bucket if they are available
+        and returns whether it did, without blocking.
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        """Blocks until the requested number of tokens is available."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+class CircuitBreaker(object):
+    """Stops sending requests after `failure_threshold`
+    consecutive failures. Once `reset_timeout` seconds have
+    passed a single trial request is let through; its result
+    either closes the circuit again or re-opens it.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        super().__init__()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if self._clock() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError(
+                        "Too many consecutive failures talking to Don Best, "
+                        "requests are paused for {} seconds".format(
+                            self.reset_timeout))
+                self.state = self.HALF_OPEN
+            elif self.state == self.HALF_OPEN:
+                raise CircuitOpenError(
+                    "A trial request to Don Best is already in progress")
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = self._clock()
+
+
+class SingleFlight(object):
+    """Coalesces concurrent calls that share a key so only
+    the first caller does the work and every other caller
+    waits for, and receives, the same result (or exception).
+    Results can optionally be reused by callers that arrive
+    within `freshness` seconds after the call completed.
+    """
+
+    class _Call(object):
+
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self, freshness=0.0, clock=time.monotonic):
+        super().__init__()
+        self.freshness = freshness
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._recent = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            if key in self._recent:
+                finished_at, result = self._recent[key]
+                if self._clock() - finished_at < self.freshness:
+                    return result
+                del self._recent[key]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if call.error is None and self.freshness > 0:
+                    now = self._clock()
+                    expired = [k for k, (finished_at, _) in self._recent.items()
+                               if now - finished_at >= self.freshness]
+                    for k in expired:
+                        del self._recent[k]
+                    self._recent[key] = (now, call.result)
+            call.done.set()
+        return call.result
+
+    def forget(self, key=None):
+        """Drops remembered results for a key, or all keys."""
+        with self._lock:
+            if key is None:
+                self._recent.clear()
+            else:
+                self._recent.pop(key, None)
+
+
 class Donbest(object):
     """"Main object that interacts with the Donbest API.
-    Handles request and response routing and manages
-    the HTTP session via the requests library.
+    Handles request and response routing and sends requests
+    through a Transport, which defaults to a requests.Session.
     """
     BASE_URL = 'http://xml.donbest.com/v2/'
 
@@ -584,7 +2665,21 @@ class Donbest(object):
                  "odds", "close", "open", "score"
                  ]
 
-    def __init__(self, token):
+    # (connect, read) timeouts in seconds
+    DEFAULT_TIMEOUT = (3.05, 30)
+
+    # Size of the chunks response bodies are read in
+    CHUNK_SIZE = 64 * 1024
+
+    # XML backends. "etree" is xml.etree.ElementTree, "auto"
+    # uses lxml when it is installed and falls back to etree.
+    PARSERS = ("etree", "lxml", "auto")
+
+    def __init__(self, token, transport=None, timeout=DEFAULT_TIMEOUT,
+                 retry=None, rate_limiter=None, circuit_breaker=None,
+                 coalesce=False, coalesce_window=0.0, parser="etree",
+                 max_response_size=None, long_running=False, pool_size=10000,
+                 history_size=0):
         super().__init__()
         if not token:
             raise APITokenMissingError(
@@ -595,32 +2690,129 @@ class Donbest(object):
             )
         else:
             self.token = token
-            self._session = requests.Session()
-            self._session.params = {"token": self.token}
+            self.endpoint = None
+            self.transport = transport if transport is not None else RequestsTransport()
+            self.timeout = timeout
+            self.retry = retry if retry is not None else RetryPolicy()
+            self.rate_limiter = rate_limiter
+            self.circuit_breaker = circuit_breaker
+            if parser not in self.PARSERS:
+                raise ValueError("parser must be one of {}".format(
+                    ", ".join(self.PARSERS)))
+            self.parser = parser
+            self.max_response_size = max_response_size
+            self._xml_parser = None
+            self.long_running = long_running
+            self.pool = ModelPool(pool_size) if long_running else None
+            self.history_size = history_size
+            self._history = {}
+            self._stats = {}
+            self._stats_lock = threading.Lock()
+            self._single_flight = None
+            if coalesce:
+                self._single_flight = SingleFlight(freshness=coalesce_window)
+
+    # Resolves the XML backend on first use so lxml
+    # is not imported until a response is parsed. Parsers
+    # are not thread-safe, so each response gets its own.
+    def _new_xml_parser(self):
+        if self._xml_parser is None:
+            self._xml_parser = _xml_backend(self.parser)
+        return self._xml_parser()
+
+    def _record_failure(self):
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_failure()
+
+    def _record_success(self):
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_success()
+
+    # Sends a GET request through the transport applying the
+    # rate limiter, circuit breaker and retry policy.
+    def _request(self, url, params, read, retry_body=True):
+        attempt = 0
+        while True:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.before_request()
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                r = self.transport.get(
+                    url, params=params, timeout=self.timeout, stream=True)
+            except TransportError:
+                self._record_failure()
+                if attempt >= self.retry.max_retries:
+                    raise
+                self.retry.sleep(self.retry.backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # Any other error still has to settle a half-open
+                # circuit or the breaker never lets a request out.
+                self._record_failure()
+                raise
+
+            failed = r.status_code >= 400 or r.status_code in self.retry.statuses
+            if failed:
+                self._record_failure()
+                if r.status_code in self.retry.statuses and attempt < self.retry.max_retries:
+                    r.close()
+                    retry_after = r.headers.get("Retry-After")
+                    self.retry.sleep(self.retry.backoff(attempt, retry_after))
+                    attempt += 1
+                    continue
+                if r.status_code >= 400:
+                    # Raised instead of r.raise_for_status() so every
+                    # transport surfaces the same exception type.
+                    r.close()
+                    raise HTTPStatusError(
+                        "{} error for url: {}".format(r.status_code, r.url))
+
+            # The body is streamed, so a connection that drops or
+            # stalls part way through fails here rather than in get().
+            try:
+                result = read(r)
+            except TransportError:
+                if not failed:
+                    self._record_failure()
+                if not retry_body or attempt >= self.retry.max_retries:
+                    raise
+                self.retry.sleep(self.retry.backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                if not failed:
+                    self._record_success()
+                raise
+            if not failed:
+                self._record_success()
+            return result
 
-    def __getattr__(self, endpoint):
-        if endpoint not in self.ENDPOINTS:
+    @classmethod
+    def _validate_endpoint(cls, endpoint):
+        if endpoint not in cls.ENDPOINTS:
             raise EndpointNotSupportedError(
                 "The endpoint you tried is "
                 "not supported or does not exist "
                 "please visit http://xml.donbest.com/v2/home "
                 "for more info on what endpoints are supported"
             )
-        else:
-            self.endpoint = endpoint
-            return self
+
+    # Returns a callable bound to the endpoint so that
+    # concurrent callers never share endpoint state.
+    def _endpoint(self, endpoint):
+        self._validate_endpoint(endpoint)
+        # Kept for backwards compatibility with callers that
+        # select an endpoint and then call the client itself.
+        self.endpoint = endpoint
+        return functools.partial(self.call, endpoint)
+
+    def __getattr__(self, endpoint):
+        return self._endpoint(endpoint)
 
     def __getitem__(self, endpoint):
-        if endpoint not in self.ENDPOINTS:
-            raise EndpointNotSupportedError(
-                "The endpoint you tried is "
-                "not supported or does not exist "
-                "please visit http://xml.donbest.com/v2/home "
-                "for more info on what endpoints are supported"
-            )
-        else:
-            self.endpoint = endpoint
-            return self
+        return self._endpoint(endpoint)
 
     def __call__(self, *args, **kwargs):
         if self.endpoint is None:
@@ -630,175 +2822,515 @@ class Donbest(object):
                 "for more info on what endpoints are supported"
             )
         else:
-            url = "{}{}/".format(self.BASE_URL, self.endpoint)
-            parse_response = kwargs.get('parse_response', True)
-            # Check to see if an individual resource
-            # was requested and if so, append it to
-            # the url.
-            request_contains_id = False
-            for key, value in kwargs.items():
-                if 'id' in key:
-                    url = "{}{}/".format(url, value)
-                    request_contains_id = True
-
-            if self.endpoint in ["odds", "open", "close"] and not request_contains_id:
-                raise InvalidParametersError(
-                    "Don Best can only return odds per league."
-                    "Please include a league id in your request."
-                    "For example, league_id=3 for NBA odds."
-                    )
-
-            if self.endpoint in ["odds", "open", "close", "event_state"] and "lastquery" in kwargs.keys():
-                self._session.params["lastquery"] = kwargs["lastquery"]
+            return self.call(self.endpoint, **kwargs)
 
-            # attempt to make the request
-            try:
-                r = self._session.get(url)
-                r.raise_for_status()
-                if "error" in r.request.url:
-                    raise ConnectionClosedError(
-                        "Donbest is throwing an unauthorized request error"
-                        "which may mean they just don't have any data"
-                        "to respond to the request with")
-            except Exception as e:
-                raise e
+    def call(self, endpoint, **kwargs):
+        """Requests an endpoint and returns the parsed response,
+        or the raw XML bytes when parse_response=False.
+        Equivalent to db.<endpoint>(**kwargs).
+        """
+        self._validate_endpoint(endpoint)
+        if self._single_flight is not None and "output" not in kwargs:
+            key = self._request_key(endpoint, kwargs)
+            return self._single_flight.do(
+                key, functools.partial(self._call, endpoint, kwargs))
+        return self._call(endpoint, kwargs)
+
+    async def call_async(self, endpoint, **kwargs):
+        """Awaitable version of call() for asyncio code. The
+        request runs in the loop's default executor so identical
+        concurrent calls from several tasks are coalesced in the
+        same way as calls from several threads.
+        """
+        import asyncio
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.call, endpoint, **kwargs))
 
+    @staticmethod
+    def _request_key(endpoint, kwargs):
+        return (endpoint,) + tuple(
+            sorted((k, str(v)) for k, v in kwargs.items()))
+
+    def _call(self, endpoint, kwargs):
+        url = "{}{}/".format(self.BASE_URL, endpoint)
+        parse_response = kwargs.get('parse_response', True)
+        # Check to see if an individual resource
+        # was requested and if so, append it to
+        # the url.
+        request_contains_id = False
+        for key, value in kwargs.items():
+            if 'id' in key:
+                url = "{}{}/".format(url, value)
+                request_contains_id = True
+
+        if endpoint in ["odds", "open", "close"] and not request_contains_id:
+            raise InvalidParametersError(
+                "Don Best can only return odds per league."
+                "Please include a league id in your request."
+                "For example, league_id=3 for NBA odds."
+                )
+
+        params = {"token": self.token}
+        if endpoint in ["odds", "open", "close", "event_state"] and "lastquery" in kwargs.keys():
+            params["lastquery"] = kwargs["lastquery"]
+
+        output = kwargs.get("output")
+
+        # Reads the body of a response; called again on a retry,
+        # so every attempt starts with an empty parser or buffer.
+        def read(r):
+            if "error" in r.url:
+                r.close()
+                raise ConnectionClosedError(
+                    "Donbest is throwing an unauthorized request error"
+                    "which may mean they just don't have any data"
+                    "to respond to the request with")
             if parse_response:
-                response = BytesIO(r.content)
-                if response.getbuffer().nbytes == 0:
+                parser = self._new_xml_parser()
+                size = self._read_body(r, parser.feed)
+                if size == 0:
                     raise EmptyResponseError(
                         "The response from the API came back empty."
                     )
-                else:
-                    node = etree.parse(response)
-
-                # The schedule feeds contain upcoming scheduled competitions
-                # and propositions for the next several days. These feeds do
-                # not contain competitions that have already been played prior
-                # to the current day.
-                if self.endpoint in ["schedule", "current_schedule", "schedule_inplay"]:
-                    schedule = []
-                    for s in node.findall(".//sport"):
-                        sport = Sport(s, donbest=self)
-                        for l in s.findall(".//league"):
-                            league = League.from_xml_collection(
-                                l, sport=sport, donbest=self)
-                            for g in l.findall(".//group"):
-                                group = Group(g, donbest=self)
-                                for e in l.findall(".//event"):
-                                    if self.endpoint == "schedule_inplay":
-                                        event = Event.from_inplay_xml_collection(
-                                            e, league=league, group=group, donbest=self)
-                                    else:
-                                        event = Event.from_full_xml_collection(
-                                            e, league=league, group=group, donbest=self)
-                                    schedule.append(event)
-                    return schedule
-
-                # Live scores feeds contain the state of the live competition,
-                # current scores and period summary. Donbest ensures that their
-                # period scores are correct without using 3rd party providers
-                # which means their scores are live and accurate.
-                if self.endpoint == "score":
-                    all_scores = []
-                    for s in node.findall(".//event"):
-                        score = Score.from_xml_collection(s, donbest=self)
-                        all_scores.append(score)
-                    if "id" in kwargs:
-                        return all_scores[0]
-                    else:
-                        return all_scores
-
-                # Lines feed contains current odds set by market making
-                # Sports Books for major North American and European sports.
-                if self.endpoint in ["odds", "open", "close"]:
-                    lines = []
-                    for e in node.findall(".//event"):
-                        event = Event(node=e, donbest=self)
-                        for l in e.findall(".//line"):
-                            line = Line.from_xml_collection(
-                                node=l, event=event, donbest=self)
-                            lines.append(line)
-
-                    return lines
-
-                # Tracks changes to an event including time/date change,
-                # rain delay as well as start, final and halftime.
-                if self.endpoint == "event_state":
-                    pass
+                return parser.close(), size
+            if output is None:
+                chunks = []
+                size = self._read_body(r, chunks.append)
+                return b"".join(chunks), size
+            elif hasattr(output, "write"):
+                return None, self._read_body(r, output.write)
+            else:
+                return None, self._read_body(r, self._buffer_writer(output))
+
+        # A file-like output cannot be rewound, so a body that
+        # fails part way through is not read again into it.
+        retry_body = parse_response or output is None or not hasattr(output, "write")
+        body, size = self._request(url, params, read, retry_body=retry_body)
+        if parse_response:
+            result = self._parse(endpoint, body, kwargs)
+            return self._finish(endpoint, result, size)
+        if output is None:
+            return self._finish(endpoint, body, size)
+        self._finish(endpoint, None, size)
+        return size
+
+    # Recycles parsed objects in long-running mode and
+    # records per-endpoint accounting and history.
+    def _finish(self, endpoint, result, size):
+        objects = reused = 0
+        if self.long_running and isinstance(result, (BaseDonbestResponse, list)):
+            result, objects, reused = self._recycle(result)
+        records = len(result) if isinstance(result, list) else int(result is not None)
+        with self._stats_lock:
+            stats = self._stats.setdefault(endpoint, {
+                "calls": 0, "bytes_received": 0, "last_response_bytes": 0,
+                "max_response_bytes": 0, "records": 0,
+                "objects_parsed": 0, "objects_reused": 0})
+            stats["calls"] += 1
+            stats["bytes_received"] += size
+            stats["last_response_bytes"] = size
+            stats["max_response_bytes"] = max(stats["max_response_bytes"], size)
+            stats["records"] += records
+            stats["objects_parsed"] += objects
+            stats["objects_reused"] += reused
+            if self.history_size and result is not None:
+                history = self._history.get(endpoint)
+                if history is None:
+                    from collections import deque
+                    history = self._history[endpoint] = deque(maxlen=self.history_size)
+                history.append(result)
+        return result
+
+    # Drops the XML nodes held by parsed objects, interns
+    # their strings and swaps them for pooled equal objects.
+    def _recycle(self, result):
+        canonical = {}
+        objects = reused = 0
+        for model in _iter_models(result):
+            objects += 1
+            updates = {"node": None}
+            for key, value in vars(model).items():
+                if isinstance(value, str):
+                    updates[key] = sys.intern(value)
+                elif isinstance(value, BaseDonbestResponse):
+                    updates[key] = canonical.get(id(value), value)
+                elif isinstance(value, list):
+                    updates[key] = [canonical.get(id(v), v) for v in value]
+            for key, value in updates.items():
+                setattr(model, key, value)
+            pooled = self.pool.canonical(model)
+            if pooled is not model:
+                reused += 1
+            canonical[id(model)] = pooled
+        if isinstance(result, list):
+            result = [canonical.get(id(v), v) for v in result]
+        else:
+            result = canonical.get(id(result), result)
+        return result, objects, reused
 
-                ### LOOK UP FEEDS ###
-
-                # A list of Stadium and Arenas for all competitions in
-                # the schedule feed
-                if self.endpoint == "location":
-                    all_locations = []
-                    for l in node.findall(".//location"):
-                        city = City(l.find(".//city"), donbest=self)
-                        location = Location.from_xml_collection(
-                            l, city=city, donbest=self)
-                        all_locations.append(location)
-                    if "id" in kwargs:
-                        return all_locations[0]
-                    else:
-                        return all_locations
-
-                # A list of Sports covered by Don Best Sports
-                if self.endpoint == "sport":
-                    all_sports = []
-                    for s in node.findall(".//sport"):
-                        sport = Sport(s, donbest=self)
-                        all_sports.append(sport)
-                    if "id" in kwargs:
-                        return all_sports[0]
-                    else:
-                        return all_sports
-
-                # A list of Leagues covered by Don Best Sports
-                if self.endpoint == "league":
-                    all_leagues = []
-                    for l in node.findall(".//league"):
-                        sport = Sport(l.find(".//sport"), donbest=self)
+    def live_board(self, league_ids=None, max_workers=None):
+        """Returns a LiveBoard joining the in-play schedule with
+        the current scores and the odds of its leagues, fetched
+        concurrently. See LiveBoard.fetch().
+        """
+        return LiveBoard.fetch(self, league_ids=league_ids, max_workers=max_workers)
+
+    def history(self, endpoint):
+        """Returns the last history_size results of an endpoint."""
+        with self._stats_lock:
+            return list(self._history.get(endpoint, ()))
+
+    def memory_stats(self):
+        """Returns per-endpoint request, byte and record counts
+        (plus parsed and reused object counts in long-running
+        mode), the estimated bytes retained by each endpoint's
+        history and the size of the model pool.
+        """
+        with self._stats_lock:
+            stats = {endpoint: dict(values) for endpoint, values in self._stats.items()}
+            histories = {endpoint: list(h) for endpoint, h in self._history.items()}
+        for endpoint, values in stats.items():
+            values["retained_bytes"] = _deep_sizeof(histories.get(endpoint, []))
+        return {"endpoints": stats,
+                "pooled_objects": len(self.pool) if self.pool is not None else 0}
+
+    # Streams the response body in chunks to sink, enforcing
+    # max_response_size, and returns the number of bytes read.
+    def _read_body(self, r, sink):
+        limit = self.max_response_size
+        try:
+            length = r.headers.get("Content-Length")
+            if limit is not None and length is not None and int(length) > limit:
+                raise ResponseTooLargeError(
+                    "The response is {} bytes which is more than the "
+                    "max_response_size of {} bytes".format(length, limit))
+            size = 0
+            for chunk in r.iter_content(self.CHUNK_SIZE):
+                size += len(chunk)
+                if limit is not None and size > limit:
+                    raise ResponseTooLargeError(
+                        "The response is larger than the max_response_size "
+                        "of {} bytes".format(limit))
+                sink(chunk)
+            return size
+        finally:
+            r.close()
+
+    # Returns a sink that copies chunks into a
+    # caller-supplied writable buffer (e.g. a bytearray).
+    @staticmethod
+    def _buffer_writer(output):
+        view = memoryview(output).cast("B")
+        offset = [0]
+
+        def write(chunk):
+            end = offset[0] + len(chunk)
+            if end > len(view):
+                raise ResponseTooLargeError(
+                    "The response does not fit in the {} byte output "
+                    "buffer".format(len(view)))
+            view[offset[0]:end] = chunk
+            offset[0] = end
+        return write
+
+    # Each feed's top-level collection is found with a single
+    # iter() pass, since the elements wrapping it differ between
+    # feeds; below that, children are read directly.
+    def _parse(self, endpoint, node, kwargs):
+        # The schedule feeds contain upcoming scheduled competitions
+        # and propositions for the next several days. These feeds do
+        # not contain competitions that have already been played prior
+        # to the current day.
+        if endpoint in ["schedule", "current_schedule", "schedule_inplay"]:
+            schedule = []
+            for s in node.iter("sport"):
+                sport = Sport(s, donbest=self)
+                for l in s.findall("league"):
+                    league = League.from_xml_collection(
+                        l, sport=sport, donbest=self)
+                    for g in l.findall("group"):
+                        group = Group(g, donbest=self)
+                        for e in g.findall("event"):
+                            if endpoint == "schedule_inplay":
+                                event = Event.from_inplay_xml_collection(
+                                    e, league=league, group=group, donbest=self)
+                            else:
+                                event = Event.from_full_xml_collection(
+                                    e, league=league, group=group, donbest=self)
+                            schedule.append(event)
+            return schedule
+
+        # Live scores feeds contain the state of the live competition,
+        # current scores and period summary. Donbest ensures that their
+        # period scores are correct without using 3rd party providers
+        # which means their scores are live and accurate.
+        if endpoint == "score":
+            all_scores = []
+            for s in node.iter("event"):
+                score = Score.from_xml_collection(s, donbest=self)
+                all_scores.append(score)
+            if "id" in kwargs:
+                return all_scores[0]
+            else:
+                return all_scores
+
+        # Lines feed contains current odds set by market making
+        # Sports Books for major North American and European sports.
+        if endpoint in ["odds", "open", "close"]:
+            lines = []
+            for e in node.iter("event"):
+                event = Event(node=e, donbest=self)
+                for l in e.findall("line"):
+                    line = Line.from_xml_collection(
+                        node=l, event=event, donbest=self)
+                    lines.append(line)
+
+            return lines
+
+        # Tracks changes to an event including time/date change,
+        # rain delay as well as start, final and halftime.
+        if endpoint == "event_state":
+            pass
+
+        ### LOOK UP FEEDS ###
+
+        # A list of Stadium and Arenas for all competitions in
+        # the schedule feed
+        if endpoint == "location":
+            all_locations = []
+            for l in node.iter("location"):
+                city = City(l.find("city"), donbest=self)
+                location = Location.from_xml_collection(
+                    l, city=city, donbest=self)
+                all_locations.append(location)
+            if "id" in kwargs:
+                return all_locations[0]
+            else:
+                return all_locations
+
+        # A list of Sports covered by Don Best Sports
+        if endpoint == "sport":
+            all_sports = []
+            for s in node.iter("sport"):
+                sport = Sport(s, donbest=self)
+                all_sports.append(sport)
+            if "id" in kwargs:
+                return all_sports[0]
+            else:
+                return all_sports
+
+        # A list of Leagues covered by Don Best Sports
+        if endpoint == "league":
+            all_leagues = []
+            for l in node.iter("league"):
+                sport = Sport(l.find("sport"), donbest=self)
+                league = League.from_xml_collection(
+                    l, sport=sport, donbest=self)
+                all_leagues.append(league)
+            if "id" in kwargs:
+                return all_leagues[0]
+            else:
+                return all_leagues
+
+        # A list of Teams covered by Don Best Sports
+        if endpoint == "team":
+            all_teams = []
+            if 'id' in kwargs:
+                league = League(next(node.iter("league"), None), donbest=self)
+                team = Team.from_xml_collection(
+                    next(node.iter("team"), None), league=league,
+                    donbest=self)
+                return team
+            else:
+                for s in node.iter("sport"):
+                    sport = Sport(s, donbest=self)
+                    for l in s.iter("league"):
                         league = League.from_xml_collection(
                             l, sport=sport, donbest=self)
-                        all_leagues.append(league)
-                    if "id" in kwargs:
-                        return all_leagues[0]
-                    else:
-                        return all_leagues
-
-                # A list of Teams covered by Don Best Sports
-                if self.endpoint == "team":
-                    all_teams = []
-                    if 'id' in kwargs:
-                        league = League(node.find(".//league"), donbest=self)
-                        team = Team.from_xml_collection(
-                            node.find(".//team"), league=league,
-                            donbest=self)
-                        return team
-                    else:
-                        for s in node.findall(".//sport"):
-                            sport = Sport(s, donbest=self)
-                            for l in s.findall(".//league"):
-                                league = League.from_xml_collection(
-                                    l, sport=sport, donbest=self)
-                                teams = l.findall(".//team")
-                                for t in teams:
-                                    team = Team.from_xml_collection(
-                                        t, league=league, donbest=self)
-                                    all_teams.append(team)
-                        return all_teams
-
-                # A list of Sports Books covered by Don Best Sports
-                if self.endpoint == "sportsbook":
-                    all_sportsbooks = []
-                    for l in node.findall(".//sportsBook"):
-                        book = Sportsbook(l, donbest=self)
-                        all_sportsbooks.append(book)
-                    if "id" in kwargs:
-                        return all_sportsbooks[0]
-                    else:
-                        return all_sportsbooks
-
+                        teams = l.iter("team")
+                        for t in teams:
+                            team = Team.from_xml_collection(
+                                t, league=league, donbest=self)
+                            all_teams.append(team)
+                return all_teams
+
+        # A list of Sports Books covered by Don Best Sports
+        if endpoint == "sportsbook":
+            all_sportsbooks = []
+            for l in node.iter("sportsBook"):
+                book = Sportsbook(l, donbest=self)
+                all_sportsbooks.append(book)
+            if "id" in kwargs:
+                return all_sportsbooks[0]
             else:
-                return(r.content)
+                return all_sportsbooks
+
+class DonbestPool(object):
+    """Spreads requests over several API tokens, each with its
+    own Donbest client and pooled session.
+
+    Requests are routed to the token with the fewest requests
+    in flight ("least_loaded") or to each token in turn
+    ("round_robin"). An optional per-token quota (requests per
+    second) is enforced with a RateLimiter per token. When a
+    token gets the Don Best error redirect, the request fails
+    over to the next token; a token that hits it `max_strikes`
+    times in a row is benched for `cooldown` seconds.
+
+    Each token gets its own transport and circuit breaker, built
+    by calling `transport_factory` and `circuit_breaker_factory`
+    (a pooled RequestsTransport and no breaker by default). Any
+    other keyword arguments are passed to each Donbest, except
+    transport, rate_limiter and circuit_breaker instances, which
+    would be shared by every token.
+    """
+    PER_TOKEN_ARGUMENTS = ("transport", "rate_limiter", "circuit_breaker")
+    STRATEGIES = ("least_loaded", "round_robin")
+
+    class _Member(object):
+
+        def __init__(self, client, limiter):
+            self.client = client
+            self.limiter = limiter
+            self.in_flight = 0
+            self.strikes = 0
+            self.benched_until = None
+
+    def __init__(self, tokens, strategy="least_loaded", quota=None, burst=None,
+                 cooldown=60.0, max_strikes=3, clock=time.monotonic,
+                 transport_factory=None, circuit_breaker_factory=None, **kwargs):
+        super().__init__()
+        if not tokens:
+            raise APITokenMissingError(
+                "DonbestPool requires at least one API token.")
+        shared = [name for name in self.PER_TOKEN_ARGUMENTS if name in kwargs]
+        if shared:
+            raise TypeError(
+                "{} would be shared by every token; use transport_factory, "
+                "circuit_breaker_factory or quota instead".format(", ".join(shared)))
+        if strategy not in self.STRATEGIES:
+            raise ValueError("strategy must be one of {}".format(
+                ", ".join(self.STRATEGIES)))
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self.max_strikes = max_strikes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._next = 0
+        self._members = []
+        for token in tokens:
+            limiter = None
+            if quota is not None:
+                limiter = RateLimiter(quota, burst=burst, clock=clock)
+            client = Donbest(
+                token,
+                transport=transport_factory() if transport_factory is not None else None,
+                circuit_breaker=circuit_breaker_factory() if circuit_breaker_factory is not None else None,
+                **kwargs)
+            self._members.append(self._Member(client, limiter))
+
+    @property
+    def clients(self):
+        return [m.client for m in self._members]
+
+    def stats(self):
+        """Returns the in-flight count, strikes and benched
+        state of each token.
+        """
+        now = self._clock()
+        with self._lock:
+            return [{"token": m.client.token, "in_flight": m.in_flight,
+                     "strikes": m.strikes,
+                     "benched": m.benched_until is not None and m.benched_until > now}
+                    for m in self._members]
+
+    # Picks the next member to try and counts the request as
+    # in flight under the same lock, so concurrent callers see
+    # each other's picks. Members are rotated by `start` so ties
+    # in least_loaded go to each token in turn, and benched tokens
+    # are skipped unless every remaining token is benched.
+    def _pick(self, start, tried):
+        now = self._clock()
+        with self._lock:
+            offset = start % len(self._members)
+            members = self._members[offset:] + self._members[:offset]
+            members = [m for m in members if m not in tried]
+            if not members:
+                return None
+            if self.strategy == "least_loaded":
+                members.sort(key=lambda m: m.in_flight)
+            healthy = [m for m in members
+                       if m.benched_until is None or m.benched_until <= now]
+            members = healthy or members
+            for member in members:
+                if member.limiter is None or member.limiter.try_acquire():
+                    member.in_flight += 1
+                    return member
+            member = members[0]
+            member.in_flight += 1
+        try:
+            member.limiter.acquire()
+        except BaseException:
+            with self._lock:
+                member.in_flight -= 1
+            raise
+        return member
+
+    def _strike(self, member):
+        with self._lock:
+            member.strikes += 1
+            if member.strikes >= self.max_strikes:
+                member.benched_until = self._clock() + self.cooldown
+                member.strikes = 0
+
+    def _validate_endpoint(self, endpoint):
+        Donbest._validate_endpoint(endpoint)
+
+    def __getattr__(self, endpoint):
+        self._validate_endpoint(endpoint)
+        return functools.partial(self.call, endpoint)
+
+    def __getitem__(self, endpoint):
+        self._validate_endpoint(endpoint)
+        return functools.partial(self.call, endpoint)
+
+    def call(self, endpoint, **kwargs):
+        """Requests an endpoint through one of the pooled tokens,
+        failing over to the others on the error redirect,
+        transport errors or an open circuit breaker.
+        """
+        self._validate_endpoint(endpoint)
+        with self._lock:
+            start = self._next
+            self._next += 1
+        tried = []
+        error = None
+        while True:
+            member = self._pick(start, tried)
+            if member is None:
+                break
+            tried.append(member)
+            try:
+                result = member.client.call(endpoint, **kwargs)
+            except ConnectionClosedError as e:
+                self._strike(member)
+                error = e
+                continue
+            except (TransportError, CircuitOpenError) as e:
+                error = e
+                continue
+            finally:
+                with self._lock:
+                    member.in_flight -= 1
+            with self._lock:
+                member.strikes = 0
+                member.benched_until = None
+            return result
+        raise error
+
+    def live_board(self, league_ids=None, max_workers=None):
+        """Returns a LiveBoard whose concurrent requests are
+        spread over the pooled tokens. See LiveBoard.fetch().
+        """
+        return LiveBoard.fetch(self, league_ids=league_ids, max_workers=max_workers)
@@ -1,28 +1,122 @@
 # donbest_test.py
 
 # built-ins
-import os, time, random
-from datetime import datetime
+import os, sys, time, random, subprocess, threading
+from datetime import datetime, timedelta
 # testing libs
-from pytest import fixture, raises, mark
+from pytest import fixture, raises, mark, importorskip
 # API wrapper
 import donbest
 
+ODDS_XML = b"""<?xml version="1.0" encoding="utf-8"?>
+<don_best_sports><id>odds</id><updated>2018-05-22T13:16:32+0</updated>
+<event id="817069" date="2018-05-23T01:05:00+0">
+<line away_rot="505" home_rot="506" time="2018-05-22T21:11:47+0" period_id="1" period="FG" type="current" sportsbook="347">
+<money away_money="330" home_money="-430" draw_money="0"/>
+<ps away_spread="8.00" home_spread="-8.00" away_price="-110" home_price="-110"/>
+<total total="226.50" over_price="-110" under_price="-110"/>
+<display away="226" home="-8"/>
+</line>
+<line away_rot="505" home_rot="506" time="2018-05-22T21:12:47+0" period_id="1" period="FG" type="current" sportsbook="348">
+<money away_money="340" home_money="-420" draw_money="0"/>
+<ps away_spread="8.50" home_spread="-8.50" away_price="-105" home_price="-115"/>
+<total total="226.00" over_price="-108" under_price="-112"/>
+<display away="226" home="-8"/>
+</line>
+</event>
+</don_best_sports>"""
+
+# Book 347 also quotes a stale "previous" line, listed last
+ODDS_PREVIOUS_XML = ODDS_XML.replace(b"</event>", b"""<line away_rot="505" home_rot="506" time="2018-05-22T20:11:47+0" period_id="1" period="FG" type="previous" sportsbook="347">
+<money away_money="500" home_money="-600" draw_money="0"/>
+</line>
+</event>""")
+
+SCORE_XML = b"""<?xml version="1.0" encoding="utf-8"?>
+<don_best_sports><id>score</id><updated>2018-05-22T13:16:32+0</updated>
+<event id="817069" league_id="3" away_rot="505" home_rot="506">
+<away_score>54</away_score><home_score>60</home_score>
+<description>HALF</description><time>2018-05-23T02:05:00+0</time>
+<period>2ND</period><period_id>2</period_id>
+<period_summary>
+<period name="1st Quarter" description="END-" time="2018-05-23T01:35:00+0" period_id="1">
+<score rot="505" value="28"/><score rot="506" value="30"/>
+</period>
+</period_summary>
+</event>
+</don_best_sports>"""
+
+SCHEDULE_XML = b"""<?xml version="1.0" encoding="utf-8"?>
+<don_best_sports><id>schedule</id><updated>2018-05-22T13:16:32+0</updated>
+<schedule><sport id="2" name="Basketball">
+<league id="3" name="NBA">
+<group id="515449" name="NBA PLAYOFFS" type="event" type_id="1">
+<event id="817069" season="postseason" date="2018-05-23T01:05:00+0" opentime="2018-05-21T01:05:00+0" name="Houston Rockets vs Golden State Warriors" event_state="circled" time_changed="false" neutral="false" game_number="1" live="true">
+<location id="680" name="Oracle Arena"/>
+<participant rot="505" side="away"><team id="21" name="Houston Rockets"/></participant>
+<participant rot="506" side="home"><team id="22" name="Golden State Warriors"/></participant>
+</event>
+</group>
+</league>
+</sport></schedule>
+</don_best_sports>"""
+
+INPLAY_XML = SCHEDULE_XML.replace(
+    b'<participant rot="505" side="away"><team id="21" name="Houston Rockets"/></participant>\n'
+    b'<participant rot="506" side="home"><team id="22" name="Golden State Warriors"/></participant>',
+    b'<participant team_id="21" name="Houston Rockets" rot="505" side="away"/>\n'
+    b'<participant team_id="22" name="Golden State Warriors" rot="506" side="home"/>')
+
+@fixture
+def fake_client():
+    transport = donbest.FakeTransport({
+        "odds": ODDS_XML,
+        "open": ODDS_XML,
+        "close": ODDS_XML,
+        "score": SCORE_XML,
+        "schedule": SCHEDULE_XML,
+        "current_schedule": SCHEDULE_XML,
+    })
+    retry = donbest.RetryPolicy(sleep=lambda seconds: None)
+    return donbest.Donbest(token="test-token", transport=transport, retry=retry)
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+# Set DONBEST_CASSETTE to a file path to record the live feeds
+# on a run with a token and replay them offline afterwards, at
+# DONBEST_CASSETTE_LATENCY times the recorded latency.
 @fixture(scope="module")
 def donbest_client():
     DONBEST_API_TOKEN = os.environ.get('DONBEST_API_TOKEN', None)
-    return donbest.Donbest(token=DONBEST_API_TOKEN)
+    DONBEST_CASSETTE = os.environ.get('DONBEST_CASSETTE', None)
+    if DONBEST_CASSETTE is None:
+        yield donbest.Donbest(token=DONBEST_API_TOKEN)
+        return
+    latency = float(os.environ.get('DONBEST_CASSETTE_LATENCY', 0))
+    with donbest.CassetteTransport(DONBEST_CASSETTE, latency=latency) as transport:
+        yield donbest.Donbest(token=DONBEST_API_TOKEN or "replay", transport=transport)
 
 @fixture()
-def random_test_ids():
+def random_test_ids(donbest_client):
+    # Seeded with the cassette path so a replay picks the
+    # same ids as the run that recorded it.
+    rng = random.Random(os.environ.get('DONBEST_CASSETTE', None))
 
     def get_ids(endpoint):
-        d = donbest_client()
-        feed = d[endpoint]()
+        feed = donbest_client[endpoint]()
         ids = []
         for f in feed:
             ids.append(f.id)
-        random.shuffle(ids)
+        rng.shuffle(ids)
         return ids[:3]
 
     return get_ids
@@ -41,8 +135,8 @@ def sport_keys():
     }
 
 @fixture
-def league_keys():
-    keys = sport_keys()
+def league_keys(sport_keys):
+    keys = dict(sport_keys)
     keys['sport'] = donbest.Sport
     return keys
 
@@ -153,6 +247,25 @@ def test_missing_api_token():
     with raises(donbest.APITokenMissingError):
         donbest_client = donbest.Donbest(token=None)
 
+def test_import_time_budget():
+    """Importing donbest and constructing a client must not
+    pull in the HTTP stack and should stay well under budget."""
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import donbest\n"
+        "donbest.Donbest(token='test-token')\n"
+        "elapsed = time.perf_counter() - start\n"
+        "print('requests' in sys.modules, 'urllib3' in sys.modules, elapsed)\n"
+    )
+    out = subprocess.check_output(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)))
+    requests_loaded, urllib3_loaded, elapsed = out.decode().split()
+    assert requests_loaded == "False"
+    assert urllib3_loaded == "False"
+    assert float(elapsed) < 0.25
+
 def test_bad_endpoint(donbest_client):
     with raises(donbest.EndpointNotSupportedError):
         bad_endpoint = donbest_client.scores()
@@ -187,18 +300,19 @@ def test_schedules(donbest_client, random_test_ids, event_keys, endpoint):
         validate_resource(resource)
 
 @mark.parametrize("endpoint,class_type,keys", [
-    ("location", donbest.Location, location_keys),
-    ("sport", donbest.Sport, sport_keys),
-    ("league", donbest.League, league_keys),
-    ("team", donbest.Team, team_keys),
-    ("sportsbook", donbest.Sportsbook, sportsbook_keys),
-    ("score", donbest.Score, score_keys)
+    ("location", donbest.Location, "location_keys"),
+    ("sport", donbest.Sport, "sport_keys"),
+    ("league", donbest.League, "league_keys"),
+    ("team", donbest.Team, "team_keys"),
+    ("sportsbook", donbest.Sportsbook, "sportsbook_keys"),
+    ("score", donbest.Score, "score_keys")
 ])
-def test_lookup_feeds(donbest_client, random_test_ids, endpoint, class_type, keys):
+def test_lookup_feeds(donbest_client, random_test_ids, request, endpoint, class_type, keys):
+    keys = request.getfixturevalue(keys)
 
     def validate_resource(resource):
         assert isinstance(resource, class_type)
-        for key, value in keys().items():
+        for key, value in keys.items():
             assert hasattr(resource, key)
             if resource[key] is not None:
                 assert isinstance(resource[key], value)
@@ -235,4 +349,936 @@ def test_odds(donbest_client, league_ids, endpoint, line_keys):
             for resource in lines:
                 validate_resource(resource)
         except (donbest.ConnectionClosedError, donbest.EmptyResponseError) as e:
-            pass
\ No newline at end of file
+            pass
+
+@mark.skipif("DONBEST_CASSETTE" not in os.environ,
+             reason="benchmarks replay a cassette recorded with DONBEST_CASSETTE")
+@mark.parametrize("endpoint", sorted(set(donbest.Donbest.ENDPOINTS)))
+def test_endpoint_benchmark(donbest_client, record_property, endpoint):
+    """Times repeated calls to every endpoint. Replays at zero
+    latency measure parsing throughput; DONBEST_CASSETTE_LATENCY=1
+    adds the recorded network latency back.
+    """
+    kwargs = {"league_id": 3} if endpoint in ("odds", "open", "close") else {}
+    calls = 5
+    start = time.perf_counter()
+    for _ in range(calls):
+        try:
+            donbest_client.call(endpoint, **kwargs)
+        except (donbest.ConnectionClosedError, donbest.EmptyResponseError):
+            pass
+    elapsed = time.perf_counter() - start
+    record_property("mean_latency_ms", 1000.0 * elapsed / calls)
+    record_property("calls_per_second", calls / elapsed)
+
+def test_fake_transport_odds(fake_client):
+    lines = fake_client.odds(league_id=3)
+    assert len(lines) == 2
+    line = lines[0]
+    assert isinstance(line, donbest.Line)
+    assert line.away_rot == 505
+    assert line.money.home_money == -430
+    url, params = fake_client.transport.calls[0]
+    assert url == donbest.Donbest.BASE_URL + "odds/3/"
+    assert params == {"token": "test-token"}
+
+def test_lastquery_is_per_request(fake_client):
+    fake_client.odds(league_id=3, lastquery=123)
+    fake_client.odds(league_id=3)
+    assert fake_client.transport.calls[0][1]["lastquery"] == 123
+    assert "lastquery" not in fake_client.transport.calls[1][1]
+
+def test_retry_on_server_error(fake_client):
+    fake_client.transport.add("score", [
+        donbest.FakeResponse(status_code=503),
+        donbest.RequestTimeoutError("timed out"),
+        SCORE_XML,
+    ])
+    scores = fake_client.score()
+    assert scores[0].home_score == 60
+    assert len(fake_client.transport.calls) == 3
+
+def test_retries_exhausted(fake_client):
+    fake_client.transport.add("score", donbest.FakeResponse(status_code=500))
+    with raises(donbest.HTTPStatusError):
+        fake_client.score()
+    assert len(fake_client.transport.calls) == fake_client.retry.max_retries + 1
+
+def test_error_redirect(fake_client):
+    fake_client.transport.add("score", donbest.FakeResponse(
+        content=b"", url=donbest.Donbest.BASE_URL + "error"))
+    with raises(donbest.ConnectionClosedError):
+        fake_client.score()
+
+def test_circuit_breaker():
+    clock = FakeClock()
+    breaker = donbest.CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    transport = donbest.FakeTransport({
+        "score": [donbest.TransportError("down"), donbest.TransportError("down"), SCORE_XML]
+    })
+    client = donbest.Donbest(
+        token="test-token", transport=transport, circuit_breaker=breaker,
+        retry=donbest.RetryPolicy(max_retries=0))
+    for _ in range(2):
+        with raises(donbest.TransportError):
+            client.score()
+    with raises(donbest.CircuitOpenError):
+        client.score()
+    assert len(transport.calls) == 2
+    clock.now += 10
+    assert client.score()[0].id == "817069"
+    assert breaker.state == donbest.CircuitBreaker.CLOSED
+
+class BrokenBodyResponse(donbest.FakeResponse):
+    """Fails with a TransportError after the first chunk."""
+
+    def iter_content(self, chunk_size=1):
+        yield self.content[:chunk_size]
+        raise donbest.TransportError("connection reset")
+
+def test_body_read_errors_are_retried():
+    url = donbest.Donbest.BASE_URL + "score/"
+    breaker = donbest.CircuitBreaker(failure_threshold=5)
+    transport = donbest.FakeTransport({"score": [BrokenBodyResponse(content=SCORE_XML, url=url), SCORE_XML]})
+    client = donbest.Donbest(
+        token="test-token", transport=transport, circuit_breaker=breaker,
+        retry=donbest.RetryPolicy(sleep=lambda seconds: None))
+    assert client.score()[0].id == "817069"
+    assert len(transport.calls) == 2
+    assert breaker.failures == 0
+
+    import io
+    transport.add("score", BrokenBodyResponse(content=SCORE_XML, url=url))
+    with raises(donbest.TransportError):
+        client.score(parse_response=False, output=io.BytesIO())
+    # a file-like output cannot be rewound, so it is not retried
+    assert len(transport.calls) == 3
+    assert breaker.failures == 1
+
+def test_stalled_body_times_out():
+    importorskip("requests")
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append(self.path)
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(SCORE_XML)))
+            self.end_headers()
+            self.wfile.write(SCORE_XML[:20])
+            self.wfile.flush()
+            time.sleep(1)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(socketserver.ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    breaker = donbest.CircuitBreaker(failure_threshold=2)
+    client = donbest.Donbest(
+        token="test-token", timeout=(1, 0.2), circuit_breaker=breaker,
+        retry=donbest.RetryPolicy(max_retries=1, sleep=lambda seconds: None))
+    client.BASE_URL = "http://127.0.0.1:{}/v2/".format(server.server_port)
+    try:
+        with raises(donbest.RequestTimeoutError):
+            client.score()
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert len(requests_seen) == 2
+    assert breaker.state == donbest.CircuitBreaker.OPEN
+
+def test_circuit_breaker_settles_on_any_outcome():
+    clock = FakeClock()
+    breaker = donbest.CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    transport = donbest.FakeTransport({"score": [
+        donbest.TransportError("down"), ValueError("bad url"),
+        donbest.FakeResponse(status_code=401), SCORE_XML]})
+    client = donbest.Donbest(
+        token="test-token", transport=transport, circuit_breaker=breaker,
+        retry=donbest.RetryPolicy(max_retries=0))
+    with raises(donbest.TransportError):
+        client.score()
+    clock.now += 10
+    with raises(ValueError):
+        client.score()
+    assert breaker.state == donbest.CircuitBreaker.OPEN
+    clock.now += 10
+    with raises(donbest.HTTPStatusError):
+        client.score()
+    assert breaker.state == donbest.CircuitBreaker.OPEN
+    clock.now += 10
+    assert client.score()[0].id == "817069"
+    assert breaker.state == donbest.CircuitBreaker.CLOSED
+
+def test_rate_limiter():
+    clock = FakeClock()
+    limiter = donbest.RateLimiter(rate=2, burst=2, clock=clock, sleep=clock.sleep)
+    for _ in range(6):
+        limiter.acquire()
+    assert clock.now == 2.0
+    assert not limiter.try_acquire()
+
+def test_backoff_is_bounded():
+    retry = donbest.RetryPolicy(backoff_factor=1, max_backoff=5)
+    for attempt in range(10):
+        assert 0 <= retry.backoff(attempt) <= 5
+    assert retry.backoff(0, retry_after="3") == 3
+
+class SlowTransport(donbest.FakeTransport):
+
+    def __init__(self, routes):
+        super().__init__(routes)
+        self.release = threading.Event()
+
+    def get(self, url, params=None, timeout=None, stream=False):
+        self.release.wait(5)
+        return super().get(url, params=params, timeout=timeout, stream=stream)
+
+def test_concurrent_calls_are_coalesced():
+    transport = SlowTransport({"odds": ODDS_XML})
+    client = donbest.Donbest(token="test-token", transport=transport, coalesce=True)
+    results = []
+
+    def worker():
+        results.append(client.odds(league_id=3))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    transport.release.set()
+    for t in threads:
+        t.join()
+    assert len(transport.calls) == 1
+    assert len(results) == 8
+    assert all(r is results[0] for r in results)
+
+    # A different league is a different request
+    client.odds(league_id=4)
+    assert len(transport.calls) == 2
+
+def test_coalesce_window():
+    clock = FakeClock()
+    flight = donbest.SingleFlight(freshness=0.5, clock=clock)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return len(calls)
+
+    assert flight.do("odds", fetch) == 1
+    clock.now += 0.4
+    assert flight.do("odds", fetch) == 1
+    clock.now += 0.2
+    assert flight.do("odds", fetch) == 2
+
+def test_coalesced_errors_are_shared():
+    flight = donbest.SingleFlight()
+
+    def fail():
+        raise donbest.EmptyResponseError("empty")
+
+    with raises(donbest.EmptyResponseError):
+        flight.do("score", fail)
+    assert flight.do("score", lambda: "ok") == "ok"
+
+def test_call_async(fake_client):
+    import asyncio
+
+    async def main():
+        return await asyncio.gather(
+            fake_client.call_async("odds", league_id=3),
+            fake_client.call_async("score"))
+
+    loop = asyncio.new_event_loop()
+    try:
+        lines, scores = loop.run_until_complete(main())
+    finally:
+        loop.close()
+    assert len(lines) == 2
+    assert scores[0].id == "817069"
+
+def test_price_conversions():
+    np = importorskip("numpy")
+    prices = [-110, 150, 0, None]
+    decimal = donbest.american_to_decimal(prices)
+    assert np.allclose(decimal[:2], [1 + 100 / 110, 2.5])
+    assert np.isnan(decimal[2:]).all()
+    probs = donbest.implied_probability([-110, -110])
+    assert np.allclose(probs, [110 / 210, 110 / 210])
+    assert np.allclose(donbest.no_vig([probs]), [[0.5, 0.5]])
+    assert np.allclose(donbest.probability_to_american([0.6, 0.4]), [-150, 150])
+
+def test_odds_board(fake_client):
+    np = importorskip("numpy")
+    board = donbest.OddsBoard(fake_client.odds(league_id=3))
+    assert len(board) == 2
+    best = board.best("money")
+    assert best["keys"] == [("817069", 1)]
+    assert list(best["price"][0, :2]) == [340, -420]
+    assert list(best["sportsbook"][0, :2]) == ["348", "348"]
+    spread = board.best("spread")
+    assert list(spread["price"][0]) == [-105, -110]
+    assert list(spread["point"][0]) == [8.5, -8.0]
+    fair = board.fair_probabilities("total")
+    assert np.allclose(np.nansum(fair, axis=1), 1)
+    consensus = board.consensus("money")
+    assert consensus["books"][0] == 2
+    assert np.isclose(np.nansum(consensus["probability"][0]), 1)
+    assert (board.hold("spread") > 0).all()
+
+def test_odds_board_ignores_previous_lines():
+    importorskip("numpy")
+    transport = donbest.FakeTransport({"odds": ODDS_PREVIOUS_XML})
+    lines = donbest.Donbest(token="test-token", transport=transport).odds(league_id=3)
+    assert len(lines) == 3
+    board = donbest.OddsBoard(lines)
+    assert len(board) == 2
+    assert list(board.best("money")["price"][0, :2]) == [340, -420]
+    assert board.consensus("money")["books"][0] == 2
+
+def test_backfill_resumes(fake_client, tmp_path):
+    runner = donbest.BackfillRunner(fake_client, league_ids=[3, 4], directory=str(tmp_path))
+    assert len(runner.plan()) == 4
+    runner.run()
+    assert not runner.failures
+    # two books x two endpoints, each for the one event found in both leagues
+    assert len(runner.line_rows) == 8
+    # the event is only scored once even though four feeds returned it
+    assert len(runner.score_rows) == 1
+    assert runner.score_rows[0]["home_score"] == 60
+    calls = len(fake_client.transport.calls)
+    assert calls == 5
+
+    resumed = donbest.BackfillRunner(fake_client, league_ids=[3, 4], directory=str(tmp_path))
+    assert resumed.plan() == []
+    resumed.run()
+    assert len(fake_client.transport.calls) == calls
+    assert resumed.line_rows == runner.line_rows
+
+    lines_path, scores_path = resumed.write(format="csv")
+    with open(lines_path) as f:
+        assert len(f.readlines()) == 9
+
+def test_backfill_date_range(fake_client, tmp_path):
+    runner = donbest.BackfillRunner(
+        fake_client, league_ids=[3], directory=str(tmp_path),
+        start=datetime(2018, 6, 1))
+    runner.run()
+    assert runner.line_rows == []
+    assert runner.score_rows == []
+
+# Reprs of the fixtures parsed by the original ElementTree
+# implementation, which every backend must reproduce.
+BASELINE_REPRS = {
+    "odds": (
+        "[<Line event=<Event id=817069, season=None, date=2018-05-23 01:05:00, opentime=None,"
+        " name=None, event_type=None, event_state=None, time_changed=None, neutral=None, game"
+        "_number=None, group=None, participants=None, league=None, location=None, live=None>,"
+        " away_rot=505, home_rot=506, time=2018-05-22 21:11:47, period_id=1, period=FG, type="
+        "current, sportsbook=347, ps=<PointSpread away_spread=8.00, home_spread=-8.00, away_p"
+        "rice=-110, home_price=-110>, money=<MoneyLine away_money=330, home_money=-430, draw_"
+        "money=0>, total=<Total total=226.50, over_price=-110, under_price=-110>, team_total="
+        "None, display_away=226, display_home=-8, no_line=None>, <Line event=<Event id=817069"
+        ", season=None, date=2018-05-23 01:05:00, opentime=None, name=None, event_type=None, "
+        "event_state=None, time_changed=None, neutral=None, game_number=None, group=None, par"
+        "ticipants=None, league=None, location=None, live=None>, away_rot=505, home_rot=506, "
+        "time=2018-05-22 21:12:47, period_id=1, period=FG, type=current, sportsbook=348, ps=<"
+        "PointSpread away_spread=8.50, home_spread=-8.50, away_price=-105, home_price=-115>, "
+        "money=<MoneyLine away_money=340, home_money=-420, draw_money=0>, total=<Total total="
+        "226.00, over_price=-108, under_price=-112>, team_total=None, display_away=226, displ"
+        "ay_home=-8, no_line=None>]"),
+    "score": (
+        "[<Score id=817069, league_id=3, away_rot=505, home_rot=506, away_score=54, home_scor"
+        "e=60, description=HALF, time=2018-05-23 02:05:00, period=2ND, period_id=2, away_scor"
+        "e_ext=None, home_score_ext=None, period_summary=[<Period name=1st Quarter, descripti"
+        "on=END-, time=2018-05-23 01:35:00, period_id=1, scores=[{'rot': '505', 'value': '28'"
+        "}, {'rot': '506', 'value': '30'}]>]>]"),
+    "schedule": (
+        "[<Event id=817069, season=postseason, date=2018-05-23 01:05:00, opentime=2018-05-21 "
+        "01:05:00, name=Houston Rockets vs Golden State Warriors, event_type=None, event_stat"
+        "e=circled, time_changed=False, neutral=False, game_number=1, group=<Group id=515449,"
+        " name=NBA PLAYOFFS, type=event, type_id=1>, participants=[<Team id=21, name=Houston "
+        "Rockets, abbreviation=None, full_name=None, information=None, league=None, rotation="
+        "505, side=away>, <Team id=22, name=Golden State Warriors, abbreviation=None, full_na"
+        "me=None, information=None, league=None, rotation=506, side=home>], league=<League id"
+        "=3, name=NBA, abbreviation=None, information=None, sport=<Sport id=2, name=Basketbal"
+        "l, abbreviation=None, information=None>>, location=<Location id=680, name=Oracle Are"
+        "na, description=None, abbreviation=None, stadium_type=None, surface_type=None, seati"
+        "ng_capacity=None, elevation=None, city=None>, live=True>]"),
+    "schedule_inplay": (
+        "[<Event id=817069, season=postseason, date=2018-05-23 01:05:00, opentime=2018-05-21 "
+        "01:05:00, name=Houston Rockets vs Golden State Warriors, event_type=None, event_stat"
+        "e=circled, time_changed=False, neutral=False, game_number=1, group=<Group id=515449,"
+        " name=NBA PLAYOFFS, type=event, type_id=1>, participants=[<Team id=21, name=Houston "
+        "Rockets, abbreviation=None, full_name=None, information=None, league=None, rotation="
+        "None, side=away, rot=505>, <Team id=22, name=Golden State Warriors, abbreviation=Non"
+        "e, full_name=None, information=None, league=None, rotation=None, side=home, rot=506>"
+        "], league=<League id=3, name=NBA, abbreviation=None, information=None, sport=<Sport "
+        "id=2, name=Basketball, abbreviation=None, information=None>>, location=<Location id="
+        "680, name=Oracle Arena, description=None, abbreviation=None, stadium_type=None, surf"
+        "ace_type=None, seating_capacity=None, elevation=None, city=None>, live=True>]"),
+}
+
+@mark.parametrize("endpoint,xml,kwargs", [
+    ("odds", ODDS_XML, {"league_id": 3}),
+    ("score", SCORE_XML, {}),
+    ("schedule", SCHEDULE_XML, {}),
+    ("schedule_inplay", INPLAY_XML, {}),
+])
+@mark.parametrize("parser", ["etree", "lxml"])
+def test_xml_backend_parity(parser, endpoint, xml, kwargs):
+    if parser == "lxml":
+        importorskip("lxml")
+    transport = donbest.FakeTransport({endpoint: xml})
+    client = donbest.Donbest(token="test-token", transport=transport, parser=parser)
+    assert repr(client.call(endpoint, **kwargs)) == BASELINE_REPRS[endpoint]
+
+def test_schedule_events_belong_to_their_group():
+    group = SCHEDULE_XML[SCHEDULE_XML.index(b"<group"):SCHEDULE_XML.index(b"</group>") + 8]
+    second = group.replace(b'id="515449"', b'id="515450"').replace(b'id="817069"', b'id="817070"')
+    transport = donbest.FakeTransport({"schedule": SCHEDULE_XML.replace(group, group + second)})
+    events = donbest.Donbest(token="test-token", transport=transport).schedule()
+    assert [(e.id, e.group.id) for e in events] == [("817069", "515449"), ("817070", "515450")]
+
+def test_unknown_parser():
+    with raises(ValueError):
+        donbest.Donbest(token="test-token", parser="sax")
+
+def test_models_do_not_mutate_source_tree():
+    import xml.etree.ElementTree as etree
+    node = etree.fromstring(
+        '<sportsBook id="276"><name>5D Reduced Juice</name>'
+        '<abbreviation>5DReduced</abbreviation>'
+        '<limits link="x" away_price="-110"/>'
+        '<region>US</region><region>EU</region></sportsBook>')
+    before = etree.tostring(node)
+    first = donbest.Sportsbook(node, donbest=None)
+    second = donbest.Sportsbook(node, donbest=None)
+    assert etree.tostring(node) == before
+    assert repr(first) == repr(second)
+    assert first.limits == {"away_price": -110}
+    assert first.region == "US"
+
+class TokenTransport(donbest.FakeTransport):
+    """Redirects requests made with the blocked tokens to the error page."""
+
+    def __init__(self, routes, blocked=()):
+        super().__init__(routes)
+        self.blocked = set(blocked)
+
+    def get(self, url, params=None, timeout=None, stream=False):
+        response = super().get(url, params=params, timeout=timeout, stream=stream)
+        if params["token"] in self.blocked:
+            return donbest.FakeResponse(url=donbest.Donbest.BASE_URL + "error")
+        return response
+
+def test_pool_round_robin():
+    transport = donbest.FakeTransport({"score": SCORE_XML})
+    pool = donbest.DonbestPool(["a", "b", "c"], strategy="round_robin",
+                               transport_factory=lambda: transport)
+    for _ in range(6):
+        pool.score()
+    tokens = [params["token"] for url, params in transport.calls]
+    assert tokens == ["a", "b", "c", "a", "b", "c"]
+
+def test_pool_least_loaded_spreads_ties():
+    transport = donbest.FakeTransport({"score": SCORE_XML})
+    pool = donbest.DonbestPool(["a", "b", "c"], transport_factory=lambda: transport)
+    for _ in range(6):
+        pool.score()
+    tokens = [params["token"] for url, params in transport.calls]
+    assert tokens == ["a", "b", "c", "a", "b", "c"]
+
+    # concurrent callers each get a different token
+    transport = SlowTransport({"score": SCORE_XML})
+    pool = donbest.DonbestPool(["a", "b", "c"], transport_factory=lambda: transport)
+    threads = [threading.Thread(target=pool.score) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while sum(s["in_flight"] for s in pool.stats()) < 3:
+        time.sleep(0.01)
+    assert [s["in_flight"] for s in pool.stats()] == [1, 1, 1]
+    transport.release.set()
+    for thread in threads:
+        thread.join()
+
+def test_pool_failover_and_bench():
+    clock = FakeClock()
+    transport = TokenTransport({"score": SCORE_XML}, blocked=["a"])
+    pool = donbest.DonbestPool(["a", "b"], strategy="round_robin", max_strikes=2,
+                               cooldown=30, clock=clock, transport_factory=lambda: transport)
+    for _ in range(4):
+        assert pool.score()[0].id == "817069"
+    # "a" failed over twice and is now benched, so only "b" is used
+    assert [s["benched"] for s in pool.stats()] == [True, False]
+    calls = len(transport.calls)
+    pool.score()
+    assert transport.calls[calls][1]["token"] == "b"
+
+    transport.blocked = {"a", "b"}
+    with raises(donbest.ConnectionClosedError):
+        pool.score()
+
+def test_pool_quota():
+    clock = FakeClock()
+    transport = donbest.FakeTransport({"score": SCORE_XML})
+    pool = donbest.DonbestPool(["a", "b"], quota=1, burst=1, clock=clock,
+                               transport_factory=lambda: transport)
+    pool.score()
+    pool.score()
+    tokens = sorted(params["token"] for url, params in transport.calls)
+    assert tokens == ["a", "b"]
+
+def test_pool_builds_per_token_objects():
+    with raises(TypeError):
+        donbest.DonbestPool(["a", "b"], circuit_breaker=donbest.CircuitBreaker())
+    transport = donbest.FakeTransport({"score": SCORE_XML})
+    pool = donbest.DonbestPool(["a", "b"], transport_factory=lambda: transport,
+                               circuit_breaker_factory=donbest.CircuitBreaker)
+    breakers = [client.circuit_breaker for client in pool.clients]
+    assert breakers[0] is not breakers[1]
+    with raises(donbest.EndpointNotSupportedError):
+        pool.bogus
+
+needs_shared_memory = mark.skipif(sys.version_info < (3, 8),
+                                  reason="multiprocessing.shared_memory needs Python 3.8+")
+
+def _read_board(name, queue):
+    board = donbest.SharedOddsBoard.attach(name)
+    snapshot = board.snapshot()
+    queue.put((snapshot.version, len(snapshot), float(snapshot.lookup("817069", "348")["away_money"][0])))
+    board.close()
+
+@needs_shared_memory
+def test_shared_odds_board(fake_client):
+    importorskip("numpy")
+    import multiprocessing
+    board = donbest.SharedOddsBoard.create(capacity=16)
+    try:
+        publisher = donbest.OddsBoardPublisher(fake_client, board, league_ids=[3, 4])
+        assert publisher.poll_once() == 1
+        # the same event from two leagues is stored once per book
+        snapshot = board.snapshot()
+        assert len(snapshot) == 2
+        assert list(snapshot.records["sportsbook"]) == [b"347", b"348"]
+        assert snapshot.lookup("817069", period_id=1)["total"].tolist() == [226.5, 226.0]
+
+        queue = multiprocessing.Queue()
+        reader = multiprocessing.Process(target=_read_board, args=(board.name, queue))
+        reader.start()
+        assert queue.get(timeout=10) == (1, 2, 340.0)
+        reader.join()
+
+        publisher.poll_once()
+        assert snapshot.valid()
+        publisher.poll_once()
+        assert not snapshot.valid()
+        with raises(donbest.StaleSnapshotError):
+            snapshot.copy()
+        assert board.snapshot().version == 3
+    finally:
+        board.close()
+        board.unlink()
+
+@needs_shared_memory
+def test_shared_odds_board_latest_lines(fake_client):
+    importorskip("numpy")
+    # a "previous" line stamped after the current one is still stale
+    fake_client.transport.add("odds", ODDS_PREVIOUS_XML.replace(
+        b'time="2018-05-22T20:11:47+0"', b'time="2018-05-22T22:11:47+0"'))
+    board = donbest.SharedOddsBoard.create(capacity=16)
+    try:
+        board.publish(fake_client.odds(league_id=3))
+        snapshot = board.snapshot()
+        assert len(snapshot) == 2
+        assert snapshot.lookup("817069", sportsbook="347", period_id=1)["away_money"].tolist() == [330.0]
+    finally:
+        board.close()
+        board.unlink()
+
+@needs_shared_memory
+def test_shared_odds_board_capacity(fake_client):
+    importorskip("numpy")
+    board = donbest.SharedOddsBoard.create(capacity=1)
+    try:
+        with raises(ValueError):
+            board.publish(fake_client.odds(league_id=3))
+    finally:
+        board.close()
+        board.unlink()
+
+class FakeDatetimeClock(object):
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += timedelta(seconds=seconds)
+
+def scheduler_client(schedule_xml):
+    transport = donbest.FakeTransport({
+        "current_schedule": schedule_xml, "odds": ODDS_XML, "score": SCORE_XML})
+    return donbest.Donbest(token="test-token", transport=transport)
+
+def test_scheduler_follows_start_time():
+    client = scheduler_client(SCHEDULE_XML.replace(b'live="true"', b'live="false"'))
+    clock = FakeDatetimeClock(datetime(2018, 5, 22, 12, 0))
+    scheduler = donbest.PollScheduler(client, clock=clock)
+    assert scheduler.tick() == [("schedule",)]
+    assert sorted(scheduler.tick()) == [("odds", "3"), ("score",)]
+    # kickoff is 13 hours away
+    assert scheduler.intervals[("odds", "3")] == 300
+    assert scheduler.tick() == []
+    clock.advance(300)
+    assert sorted(scheduler.tick()) == [("odds", "3"), ("score",)]
+
+    clock.now = datetime(2018, 5, 23, 0, 30)
+    scheduler.tick()
+    assert scheduler.intervals[("odds", "3")] == 30
+    # long after the game started nothing but the schedule is polled
+    clock.now = datetime(2018, 5, 24, 12, 0)
+    scheduler.tick()
+    assert list(scheduler.intervals) == [("schedule",)]
+
+def test_scheduler_live_flag_before_kickoff():
+    # live="true" means in-play betting is offered, not that the game started
+    client = scheduler_client(SCHEDULE_XML)
+    clock = FakeDatetimeClock(datetime(2018, 5, 19, 12, 0))
+    scheduler = donbest.PollScheduler(client, clock=clock)
+    scheduler.tick()
+    scheduler.tick()
+    assert scheduler.intervals[("odds", "3")] == 1800
+    clock.now = datetime(2018, 5, 23, 9, 0)
+    scheduler.tick()
+    assert scheduler.intervals[("odds", "3")] == scheduler.live_interval
+
+def test_scheduler_budget():
+    client = scheduler_client(SCHEDULE_XML)
+    clock = FakeDatetimeClock(datetime(2018, 5, 22, 12, 0))
+    scheduler = donbest.PollScheduler(client, clock=clock, budget=6)
+    scheduler.tick()
+    intervals = scheduler.intervals
+    assert sum(60.0 / i for i in intervals.values()) <= 6 + 1e-9
+    assert intervals[("odds", "3")] > scheduler.live_interval
+
+def test_scheduler_skips_finished_and_other_leagues():
+    client = scheduler_client(SCHEDULE_XML.replace(b'event_state="circled"', b'event_state="FINAL"'))
+    clock = FakeDatetimeClock(datetime(2018, 5, 22, 12, 0))
+    scheduler = donbest.PollScheduler(client, clock=clock)
+    scheduler.tick()
+    assert list(scheduler.intervals) == [("schedule",)]
+
+    client = scheduler_client(SCHEDULE_XML)
+    scheduler = donbest.PollScheduler(client, clock=clock, league_ids=[1])
+    scheduler.tick()
+    assert list(scheduler.intervals) == [("schedule",)]
+
+def test_raw_response_streaming(fake_client):
+    import io
+    assert fake_client.score(parse_response=False) == SCORE_XML
+    out = io.BytesIO()
+    assert fake_client.score(parse_response=False, output=out) == len(SCORE_XML)
+    assert out.getvalue() == SCORE_XML
+    buffer = bytearray(len(SCORE_XML) + 10)
+    assert fake_client.score(parse_response=False, output=buffer) == len(SCORE_XML)
+    assert bytes(buffer[:len(SCORE_XML)]) == SCORE_XML
+    with raises(donbest.ResponseTooLargeError):
+        fake_client.score(parse_response=False, output=bytearray(10))
+
+def test_chunked_parsing(fake_client):
+    fake_client.CHUNK_SIZE = 7
+    lines = fake_client.odds(league_id=3)
+    assert [line.sportsbook for line in lines] == ["347", "348"]
+
+def test_max_response_size(fake_client):
+    fake_client.max_response_size = 100
+    with raises(donbest.ResponseTooLargeError):
+        fake_client.score()
+    fake_client.transport.add("score", donbest.FakeResponse(
+        content=SCORE_XML, headers={"Content-Length": str(len(SCORE_XML))}))
+    with raises(donbest.ResponseTooLargeError):
+        fake_client.score(parse_response=False)
+    fake_client.max_response_size = len(SCORE_XML)
+    assert fake_client.score()[0].id == "817069"
+
+def test_empty_response(fake_client):
+    fake_client.transport.add("score", b"")
+    with raises(donbest.EmptyResponseError):
+        fake_client.score()
+
+def test_schedule_store(tmp_path):
+    client = scheduler_client(SCHEDULE_XML)
+    # the stale previous line must not become the best price
+    client.transport.add("odds", ODDS_PREVIOUS_XML)
+    path = str(tmp_path / "store.db")
+    store = donbest.ScheduleStore(path)
+    assert store.ingest_schedule(client.current_schedule()) == 1
+    assert store.ingest_odds(client.odds(league_id=3)) == 2
+    assert store.ingest_scores(client.score()) == 1
+    store.close()
+
+    store = donbest.ScheduleStore(path)
+    # flagged live, but not live until it starts
+    assert store.live_events(now=datetime(2018, 5, 20)) == []
+    assert len(store.events(live=False, now=datetime(2018, 5, 20))) == 1
+    live = store.live_events(league="NBA", now=datetime(2018, 5, 23, 2, 0))
+    assert len(live) == 1
+    event = live[0]
+    assert event["away_team"] == "Houston Rockets"
+    assert event["home_rot"] == 506
+    assert event["location"] == "Oracle Arena"
+    assert (event["away_score"], event["home_score"]) == (54, 60)
+    assert (event["best_away_money"], event["best_home_money"]) == (340, -420)
+    assert store.events(rotation=505)[0]["id"] == "817069"
+    assert store.events(team_id=22, day="2018-05-23")[0]["id"] == "817069"
+    assert store.events(league=1) == []
+    assert store.query("SELECT DISTINCT type FROM lines") == [{"type": "current"}]
+    store.close()
+
+def test_schedule_store_inplay_rotations():
+    transport = donbest.FakeTransport({"schedule_inplay": INPLAY_XML})
+    client = donbest.Donbest(token="test-token", transport=transport)
+    store = donbest.ScheduleStore()
+    store.ingest_schedule(client.schedule_inplay())
+    event = store.events(rotation=505)[0]
+    assert (event["away_rot"], event["home_rot"]) == (505, 506)
+
+def test_schedule_store_live_events_end():
+    client = scheduler_client(SCHEDULE_XML.replace(b'live="true"', b'live="false"'))
+    store = donbest.ScheduleStore()
+    store.ingest_schedule(client.current_schedule())
+    assert len(store.live_events(now=datetime(2018, 5, 23, 3, 0))) == 1
+    # past the live window once the feed stops flagging it live
+    assert store.live_events(now=datetime(2018, 5, 23, 9, 0)) == []
+    client = scheduler_client(SCHEDULE_XML.replace(b'event_state="circled"', b'event_state="FINAL"'))
+    store.ingest_schedule(client.current_schedule())
+    assert store.live_events(now=datetime(2018, 5, 23, 3, 0)) == []
+
+def test_rotation_resolver():
+    client = scheduler_client(SCHEDULE_XML)
+    schedule = client.current_schedule()
+    resolver = donbest.RotationResolver(schedule)
+    assert len(resolver) == 1
+    event = schedule[0]
+    assert event.participants[0].rotation == 505
+
+    line = client.odds(league_id=3)[0]
+    assert resolver.attach_line(line) is event
+    score = client.score()[0]
+    assert resolver.attach_score(score) is event
+    teams = resolver.attach_period_scores(score.period_summary[0])
+    assert [(team.name, s["value"]) for team, s in teams] == [
+        ("Houston Rockets", "28"), ("Golden State Warriors", "30")]
+    assert resolver.team_for("506", datetime(2018, 5, 23)).name == "Golden State Warriors"
+    assert resolver.resolve(999) is None
+
+    # the game moves a day and the index follows it
+    event.date = datetime(2018, 5, 24, 1, 5)
+    resolver.update([event])
+    assert resolver.resolve(505, datetime(2018, 5, 23)) == (event, event.participants[0])
+    assert resolver.resolve(506, datetime(2018, 5, 24))[1].side == "home"
+    resolver.remove(event.id)
+    assert resolver.resolve(505) is None
+
+def test_rotation_resolver_shared_rotation():
+    client = scheduler_client(SCHEDULE_XML)
+    first = client.current_schedule()[0]
+    second = client.current_schedule()[0]
+    second.id = "817070"
+    resolver = donbest.RotationResolver([first, second])
+    assert resolver.event_for(505, datetime(2018, 5, 23)) is second
+    # re-indexing or removing the first event keeps the second's entries
+    resolver.update([first])
+    assert resolver.event_for(505, datetime(2018, 5, 23)) is first
+    resolver.update([second])
+    resolver.remove(first.id)
+    assert resolver.event_for(505, datetime(2018, 5, 23)) is second
+    assert resolver.event_for(505) is second
+    # removing the owner hands the entry back to the other event
+    resolver.update([first])
+    resolver.remove(first.id)
+    assert resolver.event_for(505, datetime(2018, 5, 23)) is second
+    resolver.update([first])
+    resolver.update([second])
+    resolver.remove(second.id)
+    assert resolver.event_for(505, datetime(2018, 5, 23)) is first
+
+def test_rotation_resolver_inplay_and_scores():
+    transport = donbest.FakeTransport({"schedule_inplay": INPLAY_XML, "score": SCORE_XML})
+    client = donbest.Donbest(token="test-token", transport=transport)
+    event = client.schedule_inplay()[0]
+    resolver = donbest.RotationResolver([event])
+    assert resolver.event_for(505, datetime(2018, 5, 23)) is event
+    assert resolver.team_for(506, datetime(2018, 5, 23)).name == "Golden State Warriors"
+
+    # the game starts before midnight and is scored after it, on
+    # the day rotation 505 is reused, but the score's id names it
+    event.date = datetime(2018, 5, 22, 23, 30)
+    next_day = client.schedule_inplay()[0]
+    next_day.id = "817070"
+    next_day.date = datetime(2018, 5, 23, 23, 30)
+    resolver.update([event, next_day])
+    score = client.score()[0]
+    assert score.time.date() == next_day.date.date()
+    assert resolver.attach_score(score) is event
+    resolver.remove(event.id)
+    assert resolver.attach_score(score) is next_day
+
+def test_long_running_mode():
+    transport = donbest.FakeTransport({"odds": ODDS_XML, "schedule": SCHEDULE_XML})
+    client = donbest.Donbest(token="test-token", transport=transport,
+                             long_running=True, pool_size=50, history_size=2)
+    first = client.odds(league_id=3)
+    assert all(line.node is None and line.event.node is None for line in first)
+    for _ in range(20):
+        lines = client.odds(league_id=3)
+    # unchanged lines are shared between polls instead of reallocated
+    assert lines[0] is first[0]
+    assert lines[0].money is first[0].money
+    assert len(client.pool) <= 50
+    assert len(client.history("odds")) == 2
+
+    client.schedule()
+    stats = client.memory_stats()
+    odds = stats["endpoints"]["odds"]
+    assert odds["calls"] == 21
+    assert odds["records"] == 42
+    assert odds["bytes_received"] == 21 * len(ODDS_XML)
+    assert odds["objects_reused"] > 0
+    assert odds["retained_bytes"] > 0
+    assert stats["endpoints"]["schedule"]["records"] == 1
+    assert stats["pooled_objects"] == len(client.pool)
+
+def test_model_pool_is_bounded():
+    pool = donbest.ModelPool(maxsize=3)
+    groups = []
+    for i in range(10):
+        group = donbest.Group.__new__(donbest.Group)
+        group.id, group.name = str(i), "NBA"
+        groups.append(pool.canonical(group))
+    assert len(pool) == 3
+    duplicate = donbest.Group.__new__(donbest.Group)
+    duplicate.id, duplicate.name = "9", "NBA"
+    assert pool.canonical(duplicate) is groups[-1]
+
+def test_to_dict_does_not_strip_object(fake_client):
+    line = fake_client.odds(league_id=3)[0]
+    data = line.to_dict()
+    assert "node" not in data
+    assert line.node is not None
+
+def test_live_board(fake_client):
+    fake_client.transport.add("schedule_inplay", INPLAY_XML)
+    fake_client.transport.add("odds", ODDS_PREVIOUS_XML)
+    board = fake_client.live_board()
+    assert len(board) == 1 and "817069" in board
+    live = board["817069"]
+    assert live.event.participants[0].id == "21"
+    assert live.score.away_score == 54
+    assert [(line.sportsbook, line.type) for line in live.lines] == [
+        ("347", "current"), ("348", "current")]
+    assert board.started <= board.timestamp
+    paths = sorted(url[len(donbest.Donbest.BASE_URL):] for url, _ in fake_client.transport.calls)
+    assert paths == ["odds/3/", "schedule_inplay/", "score/"]
+
+def test_live_board_league_filter_and_missing_feeds(fake_client):
+    fake_client.transport.add("schedule_inplay", INPLAY_XML)
+    fake_client.transport.add("score", b"")
+    assert len(fake_client.live_board(league_ids=[1])) == 0
+    board = fake_client.live_board(league_ids=[3])
+    assert board["817069"].score is None
+    assert len(board["817069"].lines) == 2
+
+def test_cassette_record_and_replay(fake_client, tmp_path):
+    path = str(tmp_path / "feeds.json.gz")
+    recorder = donbest.CassetteTransport(path, mode="record", transport=fake_client.transport)
+    client = donbest.Donbest(token="secret-token", transport=recorder)
+    recorded = [client.odds(league_id=3), client.score(), client.schedule()]
+    recorder.close()
+    assert sorted(recorder.latencies()) == ["odds", "schedule", "score"]
+    import gzip
+    with gzip.open(path, "rb") as f:
+        assert b"secret-token" not in f.read()
+
+    sleeps = []
+    player = donbest.CassetteTransport(path, latency=1.0, sleep=sleeps.append)
+    assert player.mode == "replay"
+    client = donbest.Donbest(token="other-token", transport=player)
+    replayed = [client.odds(league_id=3), client.score(), client.schedule()]
+    assert len(sleeps) == 3
+    assert repr(replayed) == repr(recorded)
+    with raises(donbest.CassetteMissError):
+        client.odds(league_id=1)
+
+def test_cassette_redacts_real_requests(tmp_path):
+    importorskip("requests")
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Set-Cookie", "session=SECRETCOOKIE")
+            self.send_header("Content-Length", str(len(SCORE_XML)))
+            self.end_headers()
+            self.wfile.write(SCORE_XML)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = "http://127.0.0.1:{}/v2/".format(server.server_port)
+    path = str(tmp_path / "feeds.json.gz")
+    try:
+        with donbest.CassetteTransport(path, mode="record") as recorder:
+            client = donbest.Donbest(token="SECRETTOKEN123", transport=recorder)
+            client.BASE_URL = base_url
+            assert client.score()[0].id == "817069"
+    finally:
+        server.shutdown()
+        server.server_close()
+    import gzip
+    with gzip.open(path, "rb") as f:
+        cassette = f.read()
+    assert b"SECRETTOKEN123" not in cassette
+    assert b"SECRETCOOKIE" not in cassette
+
+    client = donbest.Donbest(token="other-token", transport=donbest.CassetteTransport(path))
+    client.BASE_URL = base_url
+    assert client.score()[0].id == "817069"
+
+def test_cassette_not_saved_without_a_clean_recording(fake_client, tmp_path):
+    path = str(tmp_path / "feeds.json.gz")
+    donbest.CassetteTransport(path, mode="record", transport=fake_client.transport).close()
+    assert not os.path.exists(path)
+    with raises(donbest.InvalidParametersError):
+        with donbest.CassetteTransport(path, transport=fake_client.transport) as recorder:
+            client = donbest.Donbest(token="test-token", transport=recorder)
+            client.score()
+            client.odds()
+    assert not os.path.exists(path)
+
+def test_cassette_replays_in_order(fake_client, tmp_path):
+    path = str(tmp_path / "feeds.json.gz")
+    fake_client.transport.add("score", [b"", SCORE_XML])
+    with donbest.CassetteTransport(path, transport=fake_client.transport) as recorder:
+        client = donbest.Donbest(token="test-token", transport=recorder)
+        with raises(donbest.EmptyResponseError):
+            client.score()
+        assert len(client.score()) == 1
+    client = donbest.Donbest(token="test-token", transport=donbest.CassetteTransport(path))
+    with raises(donbest.EmptyResponseError):
+        client.score()
+    assert len(client.score()) == 1
+    assert len(client.score()) == 1